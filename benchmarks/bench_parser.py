@@ -0,0 +1,69 @@
+##################################################################
+#############         bench_parser.py             ################
+# 1. Compares library.cond_parser with boolean_parser ###########
+#    (pyparsing) cold start time and parse throughput ############
+##################################################################
+
+# imports:
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from library.cond_parser import parse
+
+# Strings from README and examples/examples.py:
+COND_STRS = [
+    'valid = 1 and clear = 0',
+    '(not valid = 0) and clear = 0',
+    'valid = 1 and (not clear = 1)',
+    '(not valid = 0) and (not clear = 1)',
+    'clear = 1',
+    'count = 3 and done = 1',
+    'valid = erim and clear = aram',
+    'not ((valid != erim) or (clear != aram))',
+    'cat !=   1  ',
+    'not(cat=1)',
+    'cat!=1 and not(cat!=1)',
+]
+
+# Returns the best wall time in seconds of importing 'module' in a fresh interpreter
+def cold_start(module: str, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import ' + module], cwd=ROOT, check=True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+# Returns parsed strings per second for parser function 'fn'
+def throughput(fn, loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        for s in COND_STRS:
+            fn(s)
+    return loops * len(COND_STRS) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description='RoControl - condition parser benchmark')
+    parser.add_argument('-n', '--loops', type=int, default=200, help='Passes over the condition strings')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Cold start repetitions, best is reported')
+    args = parser.parse_args()
+    rows = [('library.cond_parser', cold_start('library.cond_parser', args.repeat), throughput(parse, args.loops))]
+    try:
+        from boolean_parser import parse as bp_parse
+        rows.append(('boolean_parser', cold_start('boolean_parser', args.repeat), throughput(bp_parse, args.loops)))
+    except ImportError:
+        print('boolean_parser is not installed, reporting library.cond_parser only')
+    print('%-22s %16s %18s' % ('parser', 'cold start [ms]', 'parses / second'))
+    for (name, cold, tput) in rows:
+        print('%-22s %16.1f %18.0f' % (name, cold * 1000, tput))
+
+if __name__ == "__main__":
+    main()
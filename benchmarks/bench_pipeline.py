@@ -0,0 +1,152 @@
+##################################################################
+#############         bench_pipeline.py           ################
+# 1. Parameterized synthetic FSM generator #######################
+# 2. Times every pipeline stage separately and records its #######
+#    peak memory, results are written to a JSON file #############
+##################################################################
+
+# imports:
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stderr
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from library.base_classes import arch, parse_cache_clear
+from library.inferring import get_fsm_interfaces, get_fsm_states
+from library.cond_compare import unite_conds
+from library.equiv_cache import set_default_equiv_cache
+from library.fsm_class import fsm
+from library.rebuild_cache import GENERATOR_VERSION
+
+STAGES = ['parse', 'get_fsm_interface', 'unite_conds', 'get_fsm_states', 'build_verilog', 'build_graph']
+
+# Returns a random condition string of nesting depth 'depth' over 'inputs', an input is compared to another input with probability 'rhs'
+def gen_cond(rnd: random.Random, inputs: List[str], width: int, depth: int, rhs: float) -> str:
+    if depth == 0:
+        name = rnd.choice(inputs)
+        op = rnd.choice(['=', '!=', '<', '>', '<=', '>='])
+        if rhs > 0 and len(inputs) > 1 and rnd.random() < rhs:
+            return name + ' ' + op + ' ' + rnd.choice([i for i in inputs if i != name])
+        return name + ' ' + op + ' ' + str(rnd.randrange(1 << width))
+    lop = rnd.choice(['and', 'or', 'not'])
+    if lop == 'not':
+        return 'not (' + gen_cond(rnd, inputs, width, depth - 1, rhs) + ')'
+    return '(' + gen_cond(rnd, inputs, width, depth - 1, rhs) + ') ' + lop + ' (' + gen_cond(rnd, inputs, width, depth - 1, rhs) + ')'
+
+# Returns a random output string assigning 'n_assign' outputs, an output is assigned an input with probability 'rhs'
+def gen_out(rnd: random.Random, inputs: List[str], outputs: List[str], width: int, n_assign: int, rhs: float) -> str:
+    assigns = []
+    for name in rnd.sample(outputs, min(n_assign, len(outputs))):
+        if rnd.random() < rhs:
+            assigns.append(name + ' = ' + rnd.choice(inputs))
+        else:
+            assigns.append(name + ' = ' + str(rnd.randrange(1 << width)))
+    return ' and '.join(assigns)
+
+# Returns (source, dest, cond, out) strings of a synthetic FSM, a ring through all states guarantees every state is used
+def gen_fsm(states: int, archs: int, inputs: int, outputs: int, width: int, depth: int, rhs: float, seed: int) -> List[Tuple[str, str, str, str]]:
+    rnd = random.Random(seed)
+    in_names = ['in_' + str(i) for i in range(inputs)]
+    out_names = ['out_' + str(i) for i in range(outputs)]
+    st_names = ['S' + str(i) for i in range(states)]
+    arch_strs = []
+    for i in range(archs):
+        source = st_names[i % states]
+        dest = st_names[(i + 1) % states] if i < states else rnd.choice(st_names)
+        arch_strs.append((source, dest, gen_cond(rnd, in_names, width, depth, rhs), gen_out(rnd, in_names, out_names, width, 2, rhs)))
+    return arch_strs
+
+# Stage timer, each 'with timer(stage):' block records its wall time and, if 'trace' is set, its peak traced memory
+class _stage_timer:
+    def __init__(self, trace: bool) -> None:
+        self.trace = trace
+        self.times = {}
+        self.peaks = {}
+
+    @contextmanager
+    def __call__(self, stage: str):
+        if self.trace:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        yield
+        self.times[stage] = time.perf_counter() - start
+        if self.trace:
+            self.peaks[stage] = tracemalloc.get_traced_memory()[1]
+
+# Runs every stage once on 'arch_strs', returns (stage -> seconds, stage -> peak bytes)
+# Peak memory is only traced with 'trace' set, tracing slows down the timed stages
+def run_stages(arch_strs: List[Tuple[str, str, str, str]], out_dir: str, trace: bool=False) -> Tuple[Dict[str, float], Dict[str, int]]:
+    timer = _stage_timer(trace)
+    if trace:
+        tracemalloc.start()
+    try:
+        parse_cache_clear() # Parse every string cold
+        with timer('parse'):
+            arch_list = [arch(*s) for s in arch_strs]
+        with timer('get_fsm_interface'):
+            inputs, outputs = get_fsm_interfaces(arch_list)
+        with timer('unite_conds'):
+            arch_list = unite_conds(arch_list, inputs, 'bdd', None)
+        with timer('get_fsm_states'):
+            get_fsm_states(arch_list)
+        machine = fsm([arch(*s) for s in arch_strs]) # Untimed, build stages need a complete fsm
+        with timer('build_verilog'), redirect_stderr(io.StringIO()): # Random conditions overlap, drop the warnings
+            machine.build_verilog(out_dir, force=True)
+        with timer('build_graph'):
+            machine.build_graph(out_dir, force=True, fmt=None) # DOT only, rendering measures Graphviz rather than this tool
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return timer.times, timer.peaks
+
+def main():
+    parser = argparse.ArgumentParser(description='RoControl - synthetic FSM pipeline benchmark')
+    parser.add_argument('--states', type=int, nargs='+', default=[4, 16, 64], help='Number of states, one run per value')
+    parser.add_argument('--archs-per-state', type=int, nargs='+', default=[2], help='Archs per state, one run per value')
+    parser.add_argument('--inputs', type=int, nargs='+', default=[4], help='Number of input signals, one run per value')
+    parser.add_argument('--outputs', type=int, default=4, help='Number of output signals')
+    parser.add_argument('--width', type=int, nargs='+', default=[2], help='Input and output width in bits, one run per value')
+    parser.add_argument('--depth', type=int, nargs='+', default=[2], help='Condition nesting depth, one run per value')
+    parser.add_argument('--rhs', type=float, default=0.2, help='Probability of an input signal on the right hand side')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the generator')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Timed repetitions, best is reported')
+    parser.add_argument('-o', '--output', default='bench_pipeline.json', help='Results JSON file')
+    args = parser.parse_args()
+    set_default_equiv_cache(None) # Measure analysis, not the persistent cache
+    results = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for (states, per_state, inputs, width, depth) in itertools.product(args.states, args.archs_per_state, args.inputs, args.width, args.depth):
+            params = {'states': states, 'archs': states * per_state, 'inputs': inputs, 'outputs': args.outputs,
+                      'width': width, 'depth': depth, 'rhs': args.rhs, 'seed': args.seed}
+            arch_strs = gen_fsm(**params)
+            best = {}
+            for _ in range(args.repeat):
+                for stage, t in run_stages(arch_strs, out_dir)[0].items():
+                    best[stage] = min(t, best.get(stage, t))
+            peaks = run_stages(arch_strs, out_dir, trace=True)[1]
+            stages = {}
+            for stage in STAGES:
+                stages[stage] = {'seconds': best[stage], 'peak_bytes': peaks.get(stage)}
+            results.append({'params': params, 'stages': stages, 'total_seconds': sum(best.values())})
+            print('states=%-5d archs=%-6d inputs=%-3d width=%-3d depth=%-3d total %8.1f ms  ' % (states, params['archs'], inputs, width, depth, results[-1]['total_seconds'] * 1000)
+                  + ' '.join('%s=%.1f' % (stage, best[stage] * 1000) for stage in STAGES))
+    report = {'generator_version': GENERATOR_VERSION, 'python': platform.python_version(), 'platform': platform.platform(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': args.repeat, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to ' + args.output)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-from rocon.base_classes import arch
-from rocon.fsm_class import fsm
+from library.base_classes import arch
+from library.fsm_class import fsm
 
 def cntr_exmp():
     
@@ -4,19 +4,48 @@
 # 2. output - output signal class, (name, width, default) ########
 # 3. state - state class, (name, reset) ##########################
 # 4. arch - ctrlr archs, (source, dest, cond, out, index) ########
+#    cond and out strings are parsed through a shared LRU cache ##
+#    cond_fn / out_fn are compiled into batched Python callables #
+#    on first use by the evaluation paths (simulator, exhaustive #
+#    compare mode, condition minimization) #######################
+# 5. sig_table - list of signals with O(1) lookup by name, kept ##
+#    up to date by every list mutation ###########################
 ##################################################################
 
 # imports:
-from boolean_parser import parse
+from typing import Dict, List
+from functools import lru_cache
+from library.cond_parser import parse
+from library.cond_compiler import get_sig_cols, compile_cond, compile_out
+
+_PARSE_CACHE_SIZE = 1024 # Maximum number of distinct parsed strings kept
+
+# Parse a normalized condition string, trees are shared between archs and must not be modified:
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _parse_normalized(norm_str: str):
+    return parse(norm_str)
+
+# Parse 'cond_str' through the process-wide cache, keyed on the string with whitespace runs collapsed:
+def cached_parse(cond_str: str):
+    return _parse_normalized(' '.join(cond_str.split()))
+
+# Returns the parse cache statistics (hits, misses, maxsize, currsize):
+def parse_cache_info():
+    return _parse_normalized.cache_info()
+
+def parse_cache_clear() -> None:
+    _parse_normalized.cache_clear()
 
 # Input signal class:
 class input:
+    __slots__ = ('name', 'width')
     def __init__(self, name: str, width: int) -> None:
         self.name  = name  # input signal name
         self.width = width # input signal width in bits
 
 # Output register class:
 class output:
+    __slots__ = ('name', 'width', 'default')
     def __init__(self, name: str, width: int, default: int) -> None:
         self.name    = name    # output signal name
         self.width   = width   # output signal width in bits
@@ -24,13 +53,15 @@ class output:
 
 # State class:        
 class state:
+    __slots__ = ('name', 'reset')
     def __init__(self, name: str, reset: bool) -> None:
         self.name  = name  # state name
         self.reset = reset # TRUE / FALSE: enter state @ reset
 
 # Arch class:
 class arch:
-    def __init__ (self, source: type[state]|str, dest: type[state]|str, cond_str: str, out_str: str) -> None:
+    __slots__ = ('source', 'dest', 'index', 'cond', 'out', '_sigs', '_cond_fn', '_out_fn')
+    def __init__ (self, source: type[state]|str, dest: type[state]|str, cond_str, out_str) -> None:
         if isinstance(source, str):
             self.source = state(source, False)
         else:
@@ -40,5 +71,113 @@ class arch:
         else:
             self.dest = dest
         self.index = 0
-        self.cond = parse(cond_str)
-        self.out = parse(out_str)
\ No newline at end of file
+        # cond_str / out_str are strings or already parsed trees (bulk loaders parse each distinct string once)
+        self.cond = cached_parse(cond_str) if isinstance(cond_str, str) else cond_str # Shared parse trees, treat as read-only
+        self.out = cached_parse(out_str) if isinstance(out_str, str) else out_str
+        self._sigs    = None # (inputs, outputs) the callables are compiled against, see bind()
+        self._cond_fn = None
+        self._out_fn  = None
+
+    # Set the interface cond_fn / out_fn are compiled against on first use, callables of a previous interface are dropped
+    def bind(self, inputs: List[type[input]], outputs: List[type[output]]) -> None:
+        self._sigs = (inputs, outputs)
+        self._cond_fn = None
+        self._out_fn = None
+
+    # Lower cond and out now into callables with resolved signal indices:
+    def compile(self, inputs: List[type[input]], outputs: List[type[output]]) -> None:
+        self.bind(inputs, outputs)
+        (self.cond_fn, self.out_fn)
+
+    # Compiled cond, fn(input matrix, one input vector per row) -> bool vector, None if the arch is not bound to an interface
+    @property
+    def cond_fn(self):
+        if self._cond_fn is None and self._sigs is not None:
+            self._cond_fn = compile_cond(self.cond, get_sig_cols(self._sigs[0]), batched=True)
+        return self._cond_fn
+
+    # Compiled out, fn(input matrix) -> tuple with a value vector or constant per assigned output and None for the others
+    # None if the arch is not bound to an interface
+    @property
+    def out_fn(self):
+        if self._out_fn is None and self._sigs is not None:
+            self._out_fn = compile_out(self.out, self._sigs[1], get_sig_cols(self._sigs[0]), batched=True, defaults=False)
+        return self._out_fn
+
+# Returns the condition form to emit for arch 'a', its entry in 'conds' (condition class -> tree, e.g. minimized) if any:
+def get_cond(a: type[arch], conds: Dict[int, object]=None):
+    if conds is None:
+        return a.cond
+    return conds.get(a.index, a.cond)
+
+# Signal table class, a list of input or output signals which also maps each name to its index:
+class sig_table(list):
+    __slots__ = ('cols',)
+    def __init__(self, sigs: List[type[input]]|List[type[output]]=()) -> None:
+        super().__init__(sigs)
+        self.cols = get_sig_cols(self) # signal name -> index in table
+
+    # Rebuild cols after a mutation that can move signals
+    def _reindex(self) -> None:
+        self.cols = {}
+        for i, s in enumerate(self):
+            self.cols[s.name] = i
+
+    def append(self, sig: type[input]|type[output]) -> None:
+        self.cols[sig.name] = len(self)
+        super().append(sig)
+
+    def extend(self, sigs) -> None:
+        for s in sigs:
+            self.append(s)
+
+    def __iadd__(self, sigs):
+        self.extend(sigs)
+        return self
+
+    def __imul__(self, n: int):
+        super().__imul__(n)
+        self._reindex()
+        return self
+
+    def insert(self, pos: int, sig: type[input]|type[output]) -> None:
+        super().insert(pos, sig)
+        self._reindex()
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self._reindex()
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        self._reindex()
+
+    def remove(self, sig: type[input]|type[output]) -> None:
+        super().remove(sig)
+        self._reindex()
+
+    def pop(self, pos: int=-1) -> type[input]|type[output]:
+        sig = super().pop(pos)
+        self._reindex()
+        return sig
+
+    def clear(self) -> None:
+        super().clear()
+        self.cols = {}
+
+    def reverse(self) -> None:
+        super().reverse()
+        self._reindex()
+
+    def sort(self, *args, **kwargs) -> None:
+        super().sort(*args, **kwargs)
+        self._reindex()
+
+    def index_of(self, name: str) -> int:
+        return self.cols[name]
+
+    def get(self, name: str) -> type[input]|type[output]:
+        return self[self.cols[name]]
+
+    def width_of(self, name: str) -> int:
+        return self[self.cols[name]].width
\ No newline at end of file
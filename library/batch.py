@@ -0,0 +1,138 @@
+##################################################################
+#############         batch.py                    ################
+# 1. Resolve FSM description sources into fsm instances ##########
+# 2. Build outputs of many FSMs, in a process pool, reporting ####
+#    failures per FSM without aborting the batch #################
+##################################################################
+
+# imports:
+import importlib
+import importlib.util
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+from library.fsm_class import fsm
+from library.fsm_file import FSM_FILE_EXTS, load_fsm_file
+from library.equiv_cache import get_default_equiv_cache, set_default_equiv_cache
+from library.profiling import get_default_profile, set_default_profile
+
+# Resolve 'module:function' or 'path/to/file.py:function' into the function, which returns an fsm
+# 'reload' re-executes an already imported module, file.py sources are always executed afresh
+def _get_source_fn(source: str, reload: bool=False):
+    module_name, _, fn_name = source.rpartition(':')
+    if module_name == '' or fn_name == '':
+        raise ValueError('FSM source %r is not of the form module:function or file.py:function' % source)
+    if module_name.endswith('.py'):
+        spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(module_name))[0], module_name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    elif reload and module_name in sys.modules:
+        module = importlib.reload(sys.modules[module_name])
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, fn_name)
+
+# Returns the fsm described by 'source', a description file (.fsm / .jsonl) or a function returning an fsm
+def load_fsm(source: str, reload: bool=False) -> fsm:
+    if source.endswith(FSM_FILE_EXTS):
+        return load_fsm_file(source)
+    return _get_source_fn(source, reload)()
+
+# Returns the file 'source' is read from: the description file, file.py or the module's source file
+# None if it has none or the module can not be found, loading the source reports the error
+def get_source_path(source: str) -> str:
+    if source.endswith(FSM_FILE_EXTS):
+        return source
+    module_name = source.rpartition(':')[0]
+    if module_name.endswith('.py'):
+        return module_name
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except Exception: # Missing or broken parent package (find_spec imports it), or a malformed name
+        return None
+    return None if spec is None else spec.origin
+
+# Returns a unique output subdirectory name for each source, the function or file name unless it repeats
+def get_out_names(sources: List[str]) -> List[str]:
+    names = []
+    for s in sources:
+        if s.endswith(FSM_FILE_EXTS):
+            names.append(os.path.splitext(os.path.basename(s))[0])
+        else:
+            names.append(s.rpartition(':')[2])
+    out_names = []
+    for i, name in enumerate(names):
+        if names.count(name) > 1:
+            name += '_' + str(names[:i].count(name))
+        out_names.append(name)
+    return out_names
+
+# Returns the fsm of 'source', 'minimize' merges equivalent states and reports them on stderr, 'minimize_conds' emits minimized conditions
+# 'reload' re-imports a 'module:function' source, so a long running process sees edits of its module
+def prepare_fsm(source: str, minimize: bool=False, minimize_conds: bool=False, reload: bool=False) -> fsm:
+    machine = load_fsm(source, reload)
+    if minimize:
+        for name, names in machine.minimize().items():
+            print('%s: merged %s into %s' % (source, ', '.join(names), name), file=sys.stderr)
+    if minimize_conds:
+        machine.minimize_conds()
+    return machine
+
+# Build graph, verilog and / or testbench of 'machine' into 'out_dir'
+# 'graph_opts' are passed on to fsm.build_graph (fmt, split, jobs), 'verilog_opts' to fsm.build_verilog (encoding, encoding_table, parallel_case)
+# 'tb_opts' (n_cycles, seed, fmt) are passed on to fsm.build_testbench with the state encoding of 'verilog_opts', None builds no testbench
+# 'name' (e.g. the source) prefixes the warnings of 'machine'
+def write_outputs(machine: fsm, out_dir: str, graph: bool, verilog: bool, force: bool=False, graph_opts: dict=None, verilog_opts: dict=None,
+                  tb_opts: dict=None, name: str=None) -> None:
+    if out_dir != '-':
+        os.makedirs(out_dir, exist_ok=True)
+    if (graph):
+        machine.build_graph(out_dir, force, **(graph_opts or {}))
+    if (verilog):
+        machine.build_verilog(out_dir, force, name=name, **(verilog_opts or {}))
+    if tb_opts is not None:
+        if out_dir == '-':
+            raise ValueError('testbench vectors need an output folder')
+        encoding = dict([(k, v) for k, v in (verilog_opts or {}).items() if k in ('encoding', 'encoding_table')])
+        machine.build_testbench(out_dir, force=force, **tb_opts, **encoding)
+
+# Build graph and / or verilog of a single source into 'out_dir', returns (source, error, stats)
+# error is None on success, stats is the fsm profile (fsm_stats.as_dict()) or None if profiling is disabled
+# Options are those of prepare_fsm and write_outputs
+def build_one(source: str, out_dir: str, graph: bool, verilog: bool, force: bool=False, graph_opts: dict=None, minimize: bool=False,
+              verilog_opts: dict=None, minimize_conds: bool=False, tb_opts: dict=None) -> Tuple[str, str, dict]:
+    machine = None
+    try:
+        machine = prepare_fsm(source, minimize, minimize_conds)
+        write_outputs(machine, out_dir, graph, verilog, force, graph_opts, verilog_opts, tb_opts, source)
+    except (Exception, SystemExit): # Report and carry on with the rest of the batch
+        return source, traceback.format_exc(), None
+    return source, None, None if machine.stats is None else machine.stats.as_dict()
+
+# Worker process set-up, mirrors the parent's process-wide settings
+def _init_worker(cache_path: str, profile: bool) -> None:
+    set_default_equiv_cache(cache_path)
+    set_default_profile(profile)
+
+# Build all 'sources' into per-source subdirectories of 'out_folder', using 'jobs' worker processes
+# Returns a list of (source, error, stats) tuples in 'sources' order
+def run_batch(sources: List[str], out_folder: str, graph: bool, verilog: bool, jobs: int=1, force: bool=False, graph_opts: dict=None,
+              minimize: bool=False, verilog_opts: dict=None, minimize_conds: bool=False, tb_opts: dict=None) -> List[Tuple[str, str, dict]]:
+    if out_folder == '-':
+        out_dirs = ['-'] * len(sources)
+    else:
+        out_dirs = [os.path.join(out_folder, name) for name in get_out_names(sources)]
+    if jobs <= 1 or len(sources) <= 1: # Avoid pool start-up for a single worker
+        return [build_one(s, d, graph, verilog, force, graph_opts, minimize, verilog_opts, minimize_conds, tb_opts) for s, d in zip(sources, out_dirs)]
+    results = []
+    cache = get_default_equiv_cache() # Workers share the same persistent equivalence cache file
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(None if cache is None else cache.path, get_default_profile())) as pool:
+        futures = [pool.submit(build_one, s, d, graph, verilog, force, graph_opts, minimize, verilog_opts, minimize_conds, tb_opts) for s, d in zip(sources, out_dirs)]
+        for s, f in zip(sources, futures):
+            try:
+                results.append(f.result())
+            except Exception: # Worker process died
+                results.append((s, traceback.format_exc(), None))
+    return results
@@ -0,0 +1,272 @@
+##################################################################
+#############         bdd.py                      ################
+# 1. Reduced ordered binary decision diagram (ROBDD) manager #####
+# 2. Bit-blasting of parsed conditions into the shared BDD #######
+#    node table, equivalent conditions share the same node id ####
+# 3. Run-independent fingerprint of a condition's BDD ############
+# 4. Variables are ordered signal by signal, only wide signals ###
+#    compared with each other are interleaved, and a node budget #
+#    stops blow-ups (bdd_overflow) ###############################
+##################################################################
+
+# imports:
+import hashlib
+import json
+from typing import Dict, List, Tuple
+from library.cond_parser import Condition, BoolNot, BoolAnd, BoolOr
+from library.base_classes import input
+
+# Terminal node ids:
+BDD_FALSE = 0
+BDD_TRUE  = 1
+_TERM_VAR = 1 << 30 # Terminals sit below every variable
+MAX_BDD_NODES = 1 << 17 # Default node budget of a manager
+_INTERLEAVE_WIDTH = 8 # Fingerprints keep the signal order of compared signals up to this width, their equality costs at most 2^width nodes
+
+# Raised by a bdd_manager whose node table outgrows its budget:
+class bdd_overflow(Exception):
+    pass
+
+# BDD manager class, holds a single node table shared by all conditions of an fsm:
+# 'pairs' are (name, name) of signals compared with each other, see get_compared_pairs, None if unknown
+# 'max_nodes' limits the node table, bdd_overflow is raised once it is exceeded (None: unlimited)
+class bdd_manager:
+    def __init__(self, sigs: List[type[input]], pairs: List[Tuple[str, str]]=(), max_nodes: int=MAX_BDD_NODES) -> None:
+        self.sigs      = sigs
+        self.max_nodes = max_nodes
+        self.nodes     = [(_TERM_VAR, -1, -1), (_TERM_VAR, -1, -1)] # node id -> (var, low, high)
+        self.unique    = {} # (var, low, high) -> node id
+        self.ite_memo  = {} # (f, g, h) -> node id
+        self.var_bits  = [] # var -> (signal name, bit)
+        self.bits      = self._get_bit_vars(sigs, pairs) # signal name -> list of node ids, MSB first
+
+    # Order the bits of each signal together, MSB first, so conditions over independent signals stay linear in size
+    # Signals connected by 'pairs' form a group whose bits are interleaved MSB first, so comparisons between them stay linear too
+    # A group takes the position of its first signal in 'sigs'
+    def _get_bit_vars(self, sigs: List[type[input]], pairs: List[Tuple[str, str]]) -> Dict[str, List[int]]:
+        group = {} # signal name -> group representative
+        for s in sigs:
+            group[s.name] = s.name
+        def find(name):
+            while group[name] != name:
+                group[name] = group[group[name]]
+                name = group[name]
+            return name
+        for (a, b) in pairs:
+            if a in group and b in group:
+                group[find(a)] = find(b)
+        members = {} # representative -> signals of its group, in 'sigs' order
+        for s in sigs:
+            members.setdefault(find(s.name), []).append(s)
+        bits = {}
+        var = 0
+        for s in sigs:
+            group_sigs = members.pop(find(s.name), None)
+            if group_sigs is None: # Group already laid out
+                continue
+            for g in group_sigs:
+                bits[g.name] = []
+            for b in range(max([g.width for g in group_sigs])-1, -1, -1):
+                for g in group_sigs:
+                    if b < g.width:
+                        bits[g.name].append(self.mk(var, BDD_FALSE, BDD_TRUE))
+                        self.var_bits.append((g.name, b))
+                        var += 1
+        return bits
+
+    # Return the unique node (var, low, high), applying the reduction rule:
+    def mk(self, var: int, low: int, high: int) -> int:
+        if low == high: # Redundant test
+            return low
+        key = (var, low, high)
+        node = self.unique.get(key)
+        if node is None:
+            node = len(self.nodes)
+            if self.max_nodes is not None and node >= self.max_nodes:
+                raise bdd_overflow('BDD exceeds %d nodes' % self.max_nodes)
+            self.nodes.append(key)
+            self.unique[key] = node
+        return node
+
+    # Returns the result of ite(f, g, h) without recursion (terminal case or memo), None if it has to be computed
+    def _ite_known(self, f: int, g: int, h: int) -> int:
+        if f == BDD_TRUE:
+            return g
+        if f == BDD_FALSE:
+            return h
+        if g == h:
+            return g
+        if g == BDD_TRUE and h == BDD_FALSE:
+            return f
+        return self.ite_memo.get((f, g, h))
+
+    # If-then-else, every boolean operation is derived from it
+    # Iterative on an explicit stack, the depth of the Shannon expansion is the number of variables, not bounded by Python recursion
+    def ite(self, f: int, g: int, h: int) -> int:
+        node = self._ite_known(f, g, h)
+        if node is not None:
+            return node
+        nodes = self.nodes
+        results = []
+        stack = [(f, g, h, None)] # (f, g, h, None): expand, (f, g, h, var): both cofactor results are on 'results'
+        while stack:
+            (f, g, h, var) = stack.pop()
+            if var is not None:
+                high = results.pop()
+                low = results.pop()
+                node = self.mk(var, low, high)
+                self.ite_memo[(f, g, h)] = node
+                results.append(node)
+                continue
+            node = self._ite_known(f, g, h)
+            if node is not None:
+                results.append(node)
+                continue
+            var = min(nodes[f][0], nodes[g][0], nodes[h][0]) # Top variable
+            f0, f1 = self._cofactors(f, var)
+            g0, g1 = self._cofactors(g, var)
+            h0, h1 = self._cofactors(h, var)
+            stack.append((f, g, h, var))
+            stack.append((f1, g1, h1, None))
+            stack.append((f0, g0, h0, None)) # Low cofactor first
+        return results[0]
+
+    def _cofactors(self, f: int, var: int) -> Tuple[int, int]:
+        (f_var, low, high) = self.nodes[f]
+        if f_var == var:
+            return low, high
+        return f, f
+
+    def bdd_not(self, f: int) -> int:
+        return self.ite(f, BDD_FALSE, BDD_TRUE)
+
+    def bdd_and(self, f: int, g: int) -> int:
+        return self.ite(f, g, BDD_FALSE)
+
+    def bdd_or(self, f: int, g: int) -> int:
+        return self.ite(f, BDD_TRUE, g)
+
+    def bdd_xnor(self, f: int, g: int) -> int:
+        return self.ite(f, g, self.bdd_not(g))
+
+    # Returns one input assignment, signal name -> value, for which 'f' is true (None if f is BDD_FALSE), untested bits are 0:
+    def get_sat(self, f: int) -> Dict[str, int]:
+        if f == BDD_FALSE:
+            return None
+        values = {}
+        for s in self.sigs:
+            values[s.name] = 0
+        while f != BDD_TRUE: # A reduced BDD reaches TRUE from every non-FALSE node
+            (var, low, high) = self.nodes[f]
+            if low != BDD_FALSE:
+                f = low
+            else:
+                (name, bit) = self.var_bits[var]
+                values[name] |= 1 << bit
+                f = high
+        return values
+
+    # Returns a signal's bits or a number's constant bits, MSB first:
+    def vector(self, value: str) -> List[int]:
+        if value.isdigit():
+            return [BDD_TRUE if c == '1' else BDD_FALSE for c in bin(int(value))[2:]]
+        return self.bits[value]
+
+# Zero-extend the shorter of two bit vectors so both have the same length:
+def _align(lhs: List[int], rhs: List[int]) -> Tuple[List[int], List[int]]:
+    width = max(len(lhs), len(rhs))
+    return [BDD_FALSE] * (width - len(lhs)) + lhs, [BDD_FALSE] * (width - len(rhs)) + rhs
+
+def _vec_eq(m: type[bdd_manager], lhs: List[int], rhs: List[int]) -> int:
+    node = BDD_TRUE
+    for l, r in zip(lhs, rhs):
+        node = m.bdd_and(node, m.bdd_xnor(l, r))
+    return node
+
+def _vec_lt(m: type[bdd_manager], lhs: List[int], rhs: List[int]) -> int:
+    node = BDD_FALSE # Equal vectors are not less than each other
+    for l, r in zip(reversed(lhs), reversed(rhs)): # LSB to MSB, a more significant bit overrides
+        node = m.ite(m.bdd_xnor(l, r), node, r)
+    return node
+
+# Returns the BDD node of comparison (lhs op rhs):
+def _comp_2_bdd(m: type[bdd_manager], lhs: List[int], op: str, rhs: List[int]) -> int:
+    lhs, rhs = _align(lhs, rhs)
+    if op == '=':
+        return _vec_eq(m, lhs, rhs)
+    elif op == '!=':
+        return m.bdd_not(_vec_eq(m, lhs, rhs))
+    elif op == '<':
+        return _vec_lt(m, lhs, rhs)
+    elif op == '>=':
+        return m.bdd_not(_vec_lt(m, lhs, rhs))
+    elif op == '>':
+        return _vec_lt(m, rhs, lhs)
+    elif op == '<=':
+        return m.bdd_not(_vec_lt(m, rhs, lhs))
+    else:
+        print('logical_op %s not supported yet', op)
+        exit(2)
+
+# Returns the (name, name) pairs of signals compared with each other in 'conds', to be interleaved by a bdd_manager
+# Pairs of signals up to 'width' bits are left out
+def get_compared_pairs(conds: List, sig_dict: Dict[str, type[input]], width: int=0) -> List[Tuple[str, str]]:
+    pairs = []
+    stack = list(conds)
+    while stack:
+        cond = stack.pop()
+        if isinstance(cond, Condition):
+            if not cond.value.isdigit() and max(sig_dict[cond.name].width, sig_dict[cond.value].width) > width:
+                pairs.append((cond.name, cond.value))
+        else:
+            stack += cond.conditions
+    return pairs
+
+# Recursive function, returns the BDD node id of condition 'cond':
+def cond_2_bdd(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], m: type[bdd_manager]) -> int:
+    if (isinstance(cond, Condition)): # Stopping condition
+        return _comp_2_bdd(m, m.vector(cond.name), cond.operator, m.vector(cond.value))
+    elif isinstance(cond, BoolNot): # Parse BoolNot
+        return m.bdd_not(cond_2_bdd(cond.conditions[0], m))
+    elif isinstance(cond, BoolAnd): # Parse BoolAnd
+        node = BDD_TRUE
+        for c in cond.conditions:
+            node = m.bdd_and(node, cond_2_bdd(c, m))
+        return node
+    else: # Parse BoolOr
+        node = BDD_FALSE
+        for c in cond.conditions:
+            node = m.bdd_or(node, cond_2_bdd(c, m))
+        return node
+
+# Returns a hex fingerprint of 'cond', equal for equivalent conditions across runs and fsms
+# Signals are ordered by name, so the variable order of the signals 'cond' really depends on does not change when other
+# signals are dropped, and the reduced BDD over them is canonical. Conditions comparing signals wider than _INTERLEAVE_WIDTH
+# with each other are fingerprinted with those signals interleaved, so they only match equivalent conditions comparing the same signals
+# Past 'max_nodes' BDD nodes, the fingerprint is the condition text: only identical conditions match
+def get_bdd_fingerprint(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: List[type[input]],
+                        max_nodes: int=MAX_BDD_NODES) -> str:
+    sig_dict = dict([(s.name, s) for s in sigs])
+    m = bdd_manager(sorted(sigs, key=lambda s: s.name), get_compared_pairs([cond], sig_dict, _INTERLEAVE_WIDTH), max_nodes)
+    try:
+        root = cond_2_bdd(cond, m)
+    except bdd_overflow:
+        return 'text:' + repr(cond) + '|' + ','.join([s.name + ':' + str(s.width) for s in sorted(sigs, key=lambda s: s.name)])
+    relabel = {BDD_FALSE: 0, BDD_TRUE: 1} # node id -> position in canonical node list
+    nodes, support = [], set()
+    stack = [root]
+    while stack: # Post-order walk, children are numbered before their parent
+        node = stack[-1]
+        if node in relabel:
+            stack.pop()
+            continue
+        (var, low, high) = m.nodes[node]
+        if low in relabel and high in relabel:
+            stack.pop()
+            relabel[node] = len(relabel)
+            nodes.append((m.var_bits[var], relabel[low], relabel[high]))
+            support.add(m.var_bits[var][0])
+        else:
+            stack += [high, low]
+    widths = [(s.name, s.width) for s in sigs if s.name in support]
+    return hashlib.sha256(json.dumps([sorted(widths), nodes, relabel[root]]).encode()).hexdigest()
@@ -1,21 +1,24 @@
 ##################################################################
 ##############         build_graph.py            #################
 # 1. helper functions to generate graph labels for fsm class #####
+# 2. DOT graph construction, whole fsm or a single state #########
+# 3. Parallel Graphviz rendering of DOT files ####################
 ##################################################################
 
 # imports:
-from typing import List
-from boolean_parser.actions.boolean import BoolNot, BoolAnd, BoolOr
-from boolean_parser.actions.clause import Condition
+from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+import graphviz
+from library.cond_parser import Condition, BitSelect, BoolNot, BoolAnd, BoolOr
 from library.str_manipulation import lop_2_g
-from library.base_classes import input, output
+from library.base_classes import input, output, state, arch, sig_table, get_cond
 
 # Convert arch.cond to graph label
-def cond_2_g(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: List[type[input]], label='') -> str:
-    if (isinstance(cond, Condition)): # Stopping condition
-        for s in sigs:
-            if s.name == cond.name:
-                w = s.width
+def cond_2_g(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: type[sig_table], label='') -> str:
+    if isinstance(cond, BitSelect): # Stopping condition, single bit of a signal
+        return label + ('' if cond.value == '1' else '!') + cond.name + '[' + str(cond.bit) + ']'
+    elif (isinstance(cond, Condition)): # Stopping condition
+        w = sigs.width_of(cond.name)
         if w == 1 and cond.value.isdigit(): # Short version of writing is possible
             if cond.value == '1':
                 return label + cond.name
@@ -31,11 +34,9 @@ def cond_2_g(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sig
         return label + lhs + lop_2_g(cond.logicop) + rhs
 
 # Convert arch.out to graph label, returns a list contating each outputs assigned value
-def out_2_g(cond: type[Condition]|type[BoolAnd], sigs: List[type[output]], out_list: List[int]) -> List[int]:
+def out_2_g(cond: type[Condition]|type[BoolAnd], sigs: type[sig_table], out_list: List[int]) -> List[int]:
     if (isinstance(cond, Condition)): # Stopping condition
-        for i, s in enumerate(sigs):
-            if s.name==cond.name:
-                out_list[i] = cond.value
+        out_list[sigs.index_of(cond.name)] = cond.value
         return out_list
     else: # Parse BoolAnd, no BoolNot or BoolOr allowed here
         left_list = out_2_g(cond.conditions[0], sigs, out_list)
@@ -48,7 +49,7 @@ def out_2_g(cond: type[Condition]|type[BoolAnd], sigs: List[type[output]], out_l
         return out_list # This should contain -1 values for outputs not found in cond
 
 # Wrapper function for out_2_g, converts the list of ints to a str which is the graph's output label for the specific cond
-def out_2_g_wrapper(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: List[type[output]]) -> str:
+def out_2_g_wrapper(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: type[sig_table]) -> str:
     out_list = []
     for i in range(len(sigs)):
         out_list.append(-1) # Set initially to not found
@@ -59,4 +60,46 @@ def out_2_g_wrapper(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolO
             label += str(sigs[i].default) + ', '
         else: # Assign found value
             label += str(o) + ', '
-    return label[:-2] + '}'
\ No newline at end of file
+    return label[:-2] + '}'
+
+# Add 'archs' as edges to 'graph' and returns the legend of their conditions and of the outputs
+# 'conds' maps condition classes (arch.index) to the form to print, other archs print arch.cond
+def _add_archs(graph: graphviz.Digraph, archs: List[type[arch]], inputs: type[sig_table], outputs: type[sig_table], conds: Dict[int, object]=None) -> str:
+    index_set, legend = set(), 'Transitions:\n'
+    for a in archs:
+        graph.edge(a.source.name, a.dest.name, (str(a.index) + '\n' + out_2_g_wrapper(a.out, outputs)))
+        if a.index not in index_set:
+            index_set.add(a.index)
+            legend += str(a.index) + ' --> ' + cond_2_g(get_cond(a, conds), inputs) + '\n'
+    legend += '\nOutputs:\n{'
+    for o in outputs:
+        legend += o.name + ', '
+    return legend[:-2] + '}'
+
+# Returns a fresh graph of the whole fsm
+def get_fsm_graph(default_state: type[state], states: List[type[state]], archs: List[type[arch]], reset: type[input],
+                  inputs: type[sig_table], outputs: type[sig_table], conds: Dict[int, object]=None) -> graphviz.Digraph:
+    graph = graphviz.Digraph('FSM', filename='fsm.gv') # Create an empty directed graphviz graph
+    # Add entry:
+    graph.node('', shape='point')
+    graph.edge('', default_state.name, '!'+reset.name)
+    # Add nodes:
+    for s in states:
+        graph.node(s.name)
+    # Add edges and legend:
+    graph.node(_add_archs(graph, archs, inputs, outputs, conds), shape='box')
+    return graph
+
+# Returns a graph of a single state and its outgoing archs, used to split very large fsms
+def get_state_graph(s: type[state], archs: List[type[arch]], inputs: type[sig_table], outputs: type[sig_table], conds: Dict[int, object]=None) -> graphviz.Digraph:
+    graph = graphviz.Digraph(s.name)
+    graph.node(s.name, style='bold')
+    graph.node(_add_archs(graph, archs, inputs, outputs, conds), shape='box')
+    return graph
+
+# Render DOT files 'filepaths' to format 'fmt' with up to 'jobs' concurrent dot processes, returns rendered file paths
+def render_gv_files(filepaths: List[str], fmt: str='pdf', jobs: int=1) -> List[str]:
+    if jobs <= 1 or len(filepaths) <= 1:
+        return [graphviz.render('dot', fmt, f) for f in filepaths]
+    with ThreadPoolExecutor(max_workers=jobs) as pool: # Each thread waits on its own dot subprocess
+        return list(pool.map(lambda f: graphviz.render('dot', fmt, f), filepaths))
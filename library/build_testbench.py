@@ -0,0 +1,163 @@
+##################################################################
+#############         build_testbench.py          ################
+# 1. Stimulus and expected state / output vectors, simulated in ##
+#    chunks and streamed into memory-mapped $readmemh / ##########
+#    $readmemb files #############################################
+# 2. Self-checking SystemVerilog testbench loading the vectors ###
+##################################################################
+
+# imports:
+import mmap
+from datetime import datetime
+from typing import Dict, Iterator, List, TextIO
+import numpy as np
+from library.base_classes import input, output
+from library.simulator import fsm_simulator
+
+_CHUNK_CYCLES = 1 << 16 # Cycles simulated and written per chunk
+_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+_BASES = {'hex': 4, 'bin': 1} # vector file format -> bits per digit
+TB_PREFIX = 'tb__' # Reserved for the testbench own signals, parameters and instance
+
+# Returns chunks of 'n_cycles' uniformly random input vectors (one column per input) drawn from 'seed'
+def get_random_stimulus(inputs: List[type[input]], n_cycles: int, seed: int=0, chunk_cycles: int=_CHUNK_CYCLES) -> Iterator[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_cycles, chunk_cycles):
+        n = min(chunk_cycles, n_cycles - start)
+        yield np.stack([rng.integers(0, 1 << s.width, n, dtype=np.int64) for s in inputs], axis=1).reshape(n, len(inputs))
+
+# Returns the digit characters (rows, digits + newline) of fields 'values' (rows, fields) of 'widths' bits, concatenated MSB first
+def _format_rows(values: np.ndarray, widths: List[int], bits_per_digit: int) -> np.ndarray:
+    total = sum(widths)
+    n_digits = -(-total // bits_per_digit)
+    bits = np.zeros((len(values), n_digits * bits_per_digit), dtype=np.uint8) # left padded to whole digits
+    pos = bits.shape[1] - total
+    for i, w in enumerate(widths):
+        for b in range(w - 1, -1, -1):
+            bits[:, pos] = (values[:, i] >> b) & 1
+            pos += 1
+    weights = (1 << np.arange(bits_per_digit - 1, -1, -1)).astype(np.uint8)
+    digits = bits.reshape(len(values), n_digits, bits_per_digit) @ weights
+    rows = np.empty((len(values), n_digits + 1), dtype=np.uint8)
+    rows[:, :n_digits] = _DIGITS[digits]
+    rows[:, n_digits] = ord('\n')
+    return rows
+
+# Memory-mapped vector file of fixed length lines, written chunk by chunk without keeping the vectors in memory
+class vector_file:
+    def __init__(self, path: str, n_rows: int, widths: List[int], fmt: str='hex') -> None:
+        self.widths = widths
+        self.bits_per_digit = _BASES[fmt]
+        self.line = -(-sum(widths) // self.bits_per_digit) + 1 # digits + newline
+        self.pos = 0
+        self._f = open(path, 'w+b')
+        self._f.truncate(n_rows * self.line) # Lines have a fixed length, so the file size is known up front
+        self._mm = mmap.mmap(self._f.fileno(), n_rows * self.line)
+
+    # Append rows 'values', one column per field
+    def write(self, values: np.ndarray) -> None:
+        data = _format_rows(values, self.widths, self.bits_per_digit).tobytes()
+        self._mm[self.pos:self.pos + len(data)] = data
+        self.pos += len(data)
+
+    def close(self) -> None:
+        self._mm.flush()
+        self._mm.close()
+        self._f.close()
+
+# Simulate 'stimulus' chunks from reset and stream inputs to 'stim_path' and expected {state, outputs} to 'expect_path'
+# 'codes' maps state names to the state register values compared by the testbench, returns the number of cycles written
+def write_vectors(sim: type[fsm_simulator], stimulus: Iterator[np.ndarray], n_cycles: int, stim_path: str, expect_path: str,
+                  state_width: int, codes: Dict[str, int], fmt: str='hex') -> int:
+    state_codes = np.array([codes[name] for name in sim.state_names], dtype=np.int64)
+    stim = vector_file(stim_path, n_cycles, [s.width for s in sim.inputs], fmt)
+    expect = vector_file(expect_path, n_cycles, [state_width] + [o.width for o in sim.outputs], fmt)
+    written = 0
+    current = 0 # reset state index
+    try:
+        for values in stimulus:
+            values = np.asarray(values, dtype=np.int64).reshape(-1, len(sim.inputs))
+            if written + len(values) > n_cycles:
+                raise ValueError('stimulus holds more than %d cycles' % n_cycles)
+            states, outs, current = sim.run(values, current)
+            stim.write(values)
+            expect.write(np.concatenate([state_codes[states][:, None], outs.reshape(len(values), -1)], axis=1))
+            written += len(values)
+    finally:
+        stim.close()
+        expect.close()
+    if written != n_cycles:
+        raise ValueError('stimulus holds %d cycles, expected %d' % (written, n_cycles))
+    return written
+
+# Returns the verilog declaration range of a 'width' bits vector
+def _range(width: int) -> str:
+    return '[' + str(width-1) + ':0]'
+
+# Self-checking testbench of module ctrl: loads the vector files in bulk, applies a stimulus vector after each falling clock edge
+# and compares current state and outputs with the expected vector before the next rising edge
+# Testbench own names start with TB_PREFIX, so they never collide with the DUT port names
+def write_testbench(f: TextIO, clock: input, reset: input, inputs: List[input], outputs: List[output], n_cycles: int,
+                    state_width: int, stim_name: str, expect_name: str, fmt: str='hex', max_errors: int=10) -> None:
+    for p in [clock, reset] + inputs + outputs:
+        if p.name.startswith(TB_PREFIX):
+            raise ValueError('signal name ' + p.name + ' uses the reserved testbench prefix ' + TB_PREFIX)
+    readmem = '$readmemh' if fmt == 'hex' else '$readmemb'
+    stim_width = sum([i.width for i in inputs])
+    expect_width = state_width + sum([o.width for o in outputs])
+    f.write('//| Name: ctrl_tb.sv                         |//\n')
+    f.write('//| Date: ' + datetime.today().strftime('%Y-%m-%d') + '                         |//\n')
+    f.write('//| Description: Automatically generated FSM |//\n')
+    f.write('//| Generated using RoControl python package |//\n\n')
+    f.write('module ctrl_tb ;\n\n')
+    f.write('localparam int tb__N_CYCLES   = ' + str(n_cycles) + ' ;\n')
+    f.write('localparam int tb__MAX_ERRORS = ' + str(max_errors) + ' ;\n\n')
+    f.write('// Vectors, loaded in bulk //\n')
+    if inputs: # Without inputs the stimulus file holds empty lines only
+        f.write('logic ' + _range(stim_width) + ' tb__stim_mem [0:tb__N_CYCLES-1] ;\n')
+    f.write('logic ' + _range(expect_width) + ' tb__expect_mem [0:tb__N_CYCLES-1] ;\n\n')
+    f.write('// DUT signals //\n')
+    f.write('logic ' + _range(clock.width) + ' ' + clock.name + ' = 0 ;\n')
+    f.write('logic ' + _range(reset.width) + ' ' + reset.name + ' = 0 ;\n')
+    for i in inputs:
+        f.write('logic ' + _range(i.width) + ' ' + i.name + ' ;\n')
+    for o in outputs:
+        f.write('logic ' + _range(o.width) + ' ' + o.name + ' ;\n')
+    f.write('logic ' + _range(state_width) + ' tb__state_exp ;\n')
+    for o in outputs:
+        f.write('logic ' + _range(o.width) + ' tb__exp_' + o.name + ' ;\n')
+    f.write('int tb__errors ;\n\n')
+    ports = [clock, reset] + inputs + outputs
+    f.write('ctrl tb__dut (\n')
+    f.write(',\n'.join(['   .' + p.name + '(' + p.name + ')' for p in ports]) + '\n);\n\n')
+    f.write('always #5 ' + clock.name + ' = ~' + clock.name + ' ;\n\n')
+    stim_lhs = '{' + ', '.join([i.name for i in inputs]) + '}'
+    expect_lhs = '{' + ', '.join(['tb__state_exp'] + ['tb__exp_' + o.name for o in outputs]) + '}'
+    got = '{' + ', '.join([o.name for o in outputs]) + '}' if outputs else '1\'b0' # Empty concatenations are not legal
+    want = '{' + ', '.join(['tb__exp_' + o.name for o in outputs]) + '}' if outputs else '1\'b0'
+    f.write('initial begin\n')
+    if inputs:
+        f.write('   ' + readmem + '("' + stim_name + '", tb__stim_mem) ;\n')
+    f.write('   ' + readmem + '("' + expect_name + '", tb__expect_mem) ;\n')
+    f.write('   tb__errors = 0 ;\n')
+    f.write('   for (int tb__t = 0; tb__t < tb__N_CYCLES; tb__t++) begin\n')
+    f.write('      @(negedge ' + clock.name + ') ;\n')
+    f.write('      ' + reset.name + ' = 1 ;\n') # Reset is held through the first rising edge
+    if inputs:
+        f.write('      ' + stim_lhs + ' = tb__stim_mem[tb__t] ;\n')
+    f.write('      ' + expect_lhs + ' = tb__expect_mem[tb__t] ;\n')
+    f.write('      #1 ;\n')
+    f.write('      if (tb__dut.current_state !== tb__state_exp || ' + got + ' !== ' + want + ') begin\n')
+    f.write('         tb__errors++ ;\n')
+    f.write('         if (tb__errors <= tb__MAX_ERRORS)\n')
+    f.write('            $display("cycle %0d: state %0h outputs %0h, expected state %0h outputs %0h", tb__t, tb__dut.current_state, '
+            + got + ', tb__state_exp, ' + want + ') ;\n')
+    f.write('      end\n')
+    f.write('   end\n')
+    f.write('   if (tb__errors == 0)\n')
+    f.write('      $display("PASS: %0d cycles", tb__N_CYCLES) ;\n')
+    f.write('   else\n')
+    f.write('      $display("FAIL: %0d of %0d cycles mismatch", tb__errors, tb__N_CYCLES) ;\n')
+    f.write('   $finish ;\n')
+    f.write('end\n\n')
+    f.write('endmodule:ctrl_tb\n\n')
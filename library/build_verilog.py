@@ -1,22 +1,22 @@
 ##################################################################
 #############         build_verilog.py            ################
 # 1. helper functions to generate verilog code for fsm class #####
+#    each one writes its section straight to a text stream #######
 ##################################################################
 
 # imports:
 from datetime import datetime
-from typing import List
-from boolean_parser.actions.boolean import BoolNot, BoolAnd, BoolOr
-from boolean_parser.actions.clause import Condition
-from rocon.str_manipulation import cop_2_v, lop_2_v
-from rocon.base_classes import input, output, state, arch
+from typing import Dict, List, Set, TextIO
+from library.cond_parser import Condition, BitSelect, BoolNot, BoolAnd, BoolOr
+from library.str_manipulation import cop_2_v, lop_2_v
+from library.base_classes import input, output, state, arch, sig_table, get_cond
 
 # Convert arch.cond to verilog code
-def cond_2_v(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: List[type[input]]|List[type[output]], code='') -> str:
-    if (isinstance(cond, Condition)): # Stopping condition
-        for s in sigs:
-            if s.name == cond.name:
-                w = s.width
+def cond_2_v(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: type[sig_table], code='') -> str:
+    if isinstance(cond, BitSelect): # Stopping condition, single bit of a signal
+        return code + cond.name + '[' + str(cond.bit) + ']' + cop_2_v(cond.operator) + '1\'b' + cond.value
+    elif (isinstance(cond, Condition)): # Stopping condition
+        w = sigs.width_of(cond.name)
         if cond.value.isdigit():
             return code + cond.name + cop_2_v(cond.operator) + str(w) + '\'' + bin(int(cond.value))[1:]
         else:
@@ -28,115 +28,169 @@ def cond_2_v(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sig
         rhs = '(' + cond_2_v(cond.conditions[1], sigs, code) + ')'
         return code + lhs + lop_2_v(cond.logicop) + rhs
 
-# Convert arch.out to verilog code
-def out_2_v(cond: type[Condition]|type[BoolAnd], sigs: List[type[output]], code='') -> str:
+# Convert arch.out to verilog code, one blocking assignment per output
+def out_2_v(cond: type[Condition]|type[BoolAnd], sigs: type[sig_table], code='') -> str:
     if (isinstance(cond, Condition)): # Stopping condition
-        for s in sigs:
-            if s.name == cond.name:
-                w = s.width
+        w = sigs.width_of(cond.name)
         if cond.value.isdigit():
-            return code + cond.name + cop_2_v(cond.operator) + str(w) + '\'' + bin(int(cond.value))[1:] + ';\n'
+            return code + cond.name + ' = ' + str(w) + '\'' + bin(int(cond.value))[1:] + ';\n'
         else:
-            return code + cond.name + cop_2_v(cond.operator) + cond.value + ';\n'
+            return code + cond.name + ' = ' + cond.value + ';\n'
     else: # Parse BoolAnd, no BoolOr or BoolNot are allowed in arch.out
         lhs = out_2_v(cond.conditions[0], sigs, code)
         rhs = out_2_v(cond.conditions[1], sigs, code)
         return code + lhs + rhs
 
-# Wrapper function to recursive out_2_v, used to fix ident issues with multiple outputs
-def out_2_v_wrapper(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: List[type[output]]) -> str:
-    pre_code = out_2_v(cond, sigs, '')
-    post_code = ''
-    for c in pre_code:
-        if c=='\n': # Multiple outputs
-            post_code += c + '            ' # Manual ident fixe
+# Wrapper function to recursive out_2_v, multiple outputs are grouped in a begin / end block indented under their if
+def out_2_v_wrapper(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: type[sig_table]) -> str:
+    lines = out_2_v(cond, sigs, '').splitlines(keepends=True)
+    if len(lines) == 1:
+        return lines[0]
+    return 'begin\n' + ''.join(['               ' + l for l in lines]) + '            end\n'
+
+def write_verilog_header(f: TextIO) -> None:
+    date = datetime.today().strftime('%Y-%m-%d')
+    f.write('//| Name: ctrl.sv                            |//\n')
+    f.write('//| Date: '+ date +'                         |//\n')
+    f.write('//| Description: Automatically generated FSM |//\n')
+    f.write('//| Generated using RoControl python package |//\n')
+    f.write('                                                \n')
+    f.write('module ctrl #() (                               \n')
+
+def write_verilog_interface(f: TextIO, clock: input, reset: input, inputs: List[input], outputs: List[output]) -> None:
+    ports = [('   // General //\n', None), ('   input wire', clock), ('   input wire', reset), ('   // Inputs //\n', None)]
+    ports += [('   input wire', i) for i in inputs]
+    ports += [('   // Outputs //\n', None)]
+    ports += [('   output reg', o) for o in outputs]
+    last = max([i for i, (_, sig) in enumerate(ports) if sig is not None]) # No comma after final port
+    for i, (kind, sig) in enumerate(ports):
+        if sig is None: # Comment line
+            f.write(kind)
         else:
-            post_code += c
-    return post_code[:-12] # Undo last output ident fix
+            f.write(kind + ' [' + str(sig.width-1) + ':0] ' + sig.name + (',\n' if i != last else '\n'))
+    f.write(');\n\n')
 
-def get_verilog_header() -> str:
-    date    = datetime.today().strftime('%Y-%m-%d')
-    header  =     '//| Name: ctrl.sv                            |//\n'
-    header +=     '//| Date: '+ date +'                         |//\n'
-    header +=     '//| Description: Automatically generated FSM |//\n'
-    header +=     '//| Generated using RoControl python package |//\n'
-    header +=     '                                                \n'
-    header +=     'module ctrl #() (                               \n'
-    return header 
+def write_verilog_enum(f: TextIO, clock: input, reset: input, default_state: state, states: List[state]) -> None:
+    f.write('// States enum declaration //\n')
+    f.write('typedef enum {\n')
+    f.write(',\n'.join(['   ' + s.name for s in [default_state] + states]) + '\n') # No comma after final state
+    f.write('} State ;\n')
+    f.write('State current_state, next_state ;\n')
+    f.write('always_ff @(posedge ' + clock.name + ', negedge ' + reset.name + ') begin\n')
+    f.write('   if (!' + reset.name + ')\n')
+    f.write('      current_state <= ' + default_state.name + ' ;\n')
+    f.write('   else\n')
+    f.write('      current_state <= next_state ;\n')
+    f.write('end\n\n')
 
-def get_verilog_interface(clock: input, reset: input, inputs: List[input], outputs: List[output]) -> str:
-    interface =  '   // General //\n'
-    interface += '   input wire [' + str(clock.width-1) + ':0] ' + clock.name + ',\n'
-    interface += '   input wire [' + str(reset.width-1) + ':0] ' + reset.name + ',\n'
-    interface += '   // Inputs //\n'
-    for i in range(len(inputs)):
-        interface += '   input wire [' + str(inputs[i].width-1) + ':0] ' + inputs[i].name + ',\n'
-    interface += '   // Outputs //\n'
-    for i in range(len(outputs)):
-        interface += '   output reg [' + str(outputs[i].width-1) + ':0] ' + outputs[i].name + ',\n'
-    interface = interface[:-2] + '\n);\n' # Remove final comma and add ); at the end
-    return interface + '\n'
+# Enum declaration with explicit codes, 'codes' maps state name -> code of a binary, gray or user encoding
+def write_verilog_encoded_enum(f: TextIO, clock: input, reset: input, default_state: state, states: List[state], width: int, codes: Dict[str, int]) -> None:
+    f.write('// States enum declaration //\n')
+    f.write('typedef enum logic [' + str(width-1) + ':0] {\n')
+    all_states = [default_state] + states
+    for i, s in enumerate(all_states):
+        f.write('   ' + s.name + ' = ' + str(width) + '\'b' + format(codes[s.name], '0' + str(width) + 'b') + (',\n' if i != len(all_states) - 1 else '\n'))
+    f.write('} State ;\n')
+    f.write('State current_state, next_state ;\n')
+    f.write('always_ff @(posedge ' + clock.name + ', negedge ' + reset.name + ') begin\n')
+    f.write('   if (!' + reset.name + ')\n')
+    f.write('      current_state <= ' + default_state.name + ' ;\n')
+    f.write('   else\n')
+    f.write('      current_state <= next_state ;\n')
+    f.write('end\n\n')
 
-def get_verilog_enum(clock: input, reset: input, default_state: state, states: List[state]) -> str:
-    enum = '// States enum declaration //\n'
-    enum += 'typedef enum {\n   ' + default_state.name + ',\n'
-    for i in range(len(states)):
-        enum += '   ' + states[i].name + ',\n'
-    enum += '} State ;\n'
-    enum += 'State current_state, next_state ;\n'
-    enum += 'always_ff @(posedge ' + clock.name + ', negedge ' + reset.name + ') begin\n'
-    enum += '   if (!' + reset.name + ')\n'
-    enum += '      current_state <= ' + default_state.name + ' ;\n'
-    enum += '   else\n'
-    enum += '      current_state <= next_state ;\n'
-    enum += 'end\n'
-    return enum + '\n'
+# One-hot state register, each state name is the index of its bit
+def write_verilog_onehot_enum(f: TextIO, clock: input, reset: input, default_state: state, states: List[state]) -> None:
+    all_states = [default_state] + states
+    width = len(all_states)
+    f.write('// States one-hot bit indices //\n')
+    for i, s in enumerate(all_states):
+        f.write('localparam int ' + s.name + ' = ' + str(i) + ' ;\n')
+    f.write('logic [' + str(width-1) + ':0] current_state, next_state ;\n')
+    f.write('always_ff @(posedge ' + clock.name + ', negedge ' + reset.name + ') begin\n')
+    f.write('   if (!' + reset.name + ')\n')
+    f.write('      current_state <= ' + str(width) + '\'b' + format(1, '0' + str(width) + 'b') + ' ;\n') # default state is bit 0
+    f.write('   else\n')
+    f.write('      current_state <= next_state ;\n')
+    f.write('end\n\n')
 
-def get_verilog_ns_logic(inputs: List[input], states: List[state], archs: List[arch]) -> str:
-    ns_logic =  '// Next state logic //\n'
-    ns_logic += 'always_comb begin\n'
-    ns_logic += '   case(current_state)\n'
+# 'state_archs' maps each source state name to its archs in arch_list order
+# States in 'parallel' have disjoint outgoing conditions, their chain is emitted as 'unique if' so it decodes without priority
+# 'conds' maps condition classes (arch.index) to the form to emit, e.g. minimized ones, other archs emit arch.cond
+def write_verilog_ns_logic(f: TextIO, inputs: type[sig_table], states: List[state], state_archs: Dict[str, List[arch]], parallel: Set[str]=frozenset(),
+                           conds: Dict[int, object]=None) -> None:
+    f.write('// Next state logic //\n')
+    f.write('always_comb begin\n')
+    f.write('   next_state = current_state ;\n') # States without archs stay, no latch
+    f.write('   case(current_state)\n')
     for s in states:
-        a_list = []
-        for a in archs: 
-            if a.source.name == s.name:
-                a_list.append(a)
+        a_list = state_archs.get(s.name, [])
         if len(a_list)==0:
             continue
-        else:
-            ns_logic += '      ' + s.name + ': begin\n'
-            ns_logic += '         if ' + cond_2_v(a_list[0].cond, inputs) + '\n'
-            ns_logic += '            next_state = ' + a_list[0].dest.name + ';\n'
-            for i in range(len(a_list)):
-                if i != 0:
-                    ns_logic += '         else if ' + cond_2_v(a_list[i].cond, inputs) + '\n'
-                    ns_logic += '            next_state = ' + a_list[i].dest.name + ';\n'
-            ns_logic += '         else\n'
-            ns_logic += '            next_state = ' + s.name + ';\n'
-        ns_logic += '      end\n'
-    ns_logic += '   endcase\n'
-    ns_logic += 'end\n'
-    return ns_logic + '\n'
+        f.write('      ' + s.name + ': begin\n')
+        first = '         unique if ' if s.name in parallel and len(a_list) > 1 else '         if '
+        for i, a in enumerate(a_list):
+            f.write((first if i == 0 else '         else if ') + '(' + cond_2_v(get_cond(a, conds), inputs) + ')\n')
+            f.write('            next_state = ' + a.dest.name + ';\n')
+        f.write('         else\n')
+        f.write('            next_state = ' + s.name + ';\n')
+        f.write('      end\n')
+    f.write('   endcase\n')
+    f.write('end\n\n')
+
+def write_verilog_out_logic(f: TextIO, outputs: type[sig_table], states: List[state], state_archs: Dict[str, List[arch]]) -> None:
+    f.write('// Output logic //\n')
+    f.write('always_comb begin\n')
+    for o in outputs:
+        f.write('   ' + o.name + ' = ' + str(o.width) + '\'' + bin(o.default)[1:] + ' ;\n')
+    f.write('   case(current_state)\n')
+    for s in states:
+        f.write('      ' + s.name + ': begin\n')
+        for a in state_archs.get(s.name, []):
+            f.write('         if (next_state == ' + a.dest.name + ')\n')
+            f.write('            ' + out_2_v_wrapper(a.out, outputs))
+        f.write('      ' + 'end\n')
+    f.write('   endcase\n')
+    f.write('end\n\n')
+
+# One-hot next state logic, one equation per state bit instead of a case decode
+# Arch k of state p sets its dest bit when p is active, its condition is met and none of the conditions of archs 0..k-1 of p is
+# A state bit also stays set when none of its archs' conditions is met
+# States in 'parallel' have disjoint outgoing conditions, their archs need no negated higher priority conditions
+def write_verilog_onehot_ns_logic(f: TextIO, inputs: type[sig_table], states: List[state], state_archs: Dict[str, List[arch]], parallel: Set[str]=frozenset(),
+                                  conds: Dict[int, object]=None) -> None:
+    terms = {} # dest state name -> product terms setting its bit
+    for s in states:
+        terms[s.name] = []
+    for s in states:
+        prior = [] # negated conditions of the higher priority archs of s
+        for a in state_archs.get(s.name, []):
+            cond = '(' + cond_2_v(get_cond(a, conds), inputs) + ')'
+            terms[a.dest.name].append('&&'.join(['current_state[' + s.name + ']'] + ([] if s.name in parallel else prior) + [cond]))
+            prior.append('!' + cond)
+        terms[s.name].append('&&'.join(['current_state[' + s.name + ']'] + prior)) # No arch taken: stay
+    f.write('// Next state logic, one-hot //\n')
+    for s in states:
+        lhs = 'assign next_state[' + s.name + '] = '
+        f.write(lhs + ('\n' + ' ' * (len(lhs) - 3) + '|| ').join(['(' + t + ')' for t in terms[s.name]]) + ' ;\n')
+    f.write('\n')
 
-def get_verilog_out_logic(outputs: List[output], states: List[state], archs: List[arch]) -> str:
-    out_logic   = '// Output logic //\n'
-    out_logic  += 'always_comb begin\n'
+# One-hot output logic, single bit tests of the current and next state
+def write_verilog_onehot_out_logic(f: TextIO, outputs: type[sig_table], states: List[state], state_archs: Dict[str, List[arch]]) -> None:
+    f.write('// Output logic, one-hot //\n')
+    f.write('always_comb begin\n')
     for o in outputs:
-        out_logic += '   ' + o.name + ' = ' + str(o.width) + '\'' + bin(o.default)[1:] + ' ;\n'
-    out_logic += '   case(current_state)\n'
+        f.write('   ' + o.name + ' = ' + str(o.width) + '\'' + bin(o.default)[1:] + ' ;\n')
+    f.write('   unique case(1\'b1)\n')
     for s in states:
-        out_logic += '      ' + s.name + ': begin\n'
-        for a in archs: 
-            if a.source.name == s.name:
-                out_logic += '         if (next_state == ' + a.dest.name + ')\n'
-                out_logic += '            ' + out_2_v_wrapper(a.out, outputs)
-        out_logic += '      ' + 'end\n'
-    out_logic += '   endcase\n'
-    out_logic += 'end\n'
-    
-    return out_logic + '\n'
-    
-def get_verilog_footer() -> str:
-    footer  = 'endmodule:ctrl\n\n'
-    footer += '//| Enjoy!                                       |//\n'
-    return footer
\ No newline at end of file
+        f.write('      current_state[' + s.name + ']: begin\n')
+        for a in state_archs.get(s.name, []):
+            f.write('         if (next_state[' + a.dest.name + '])\n')
+            f.write('            ' + out_2_v_wrapper(a.out, outputs))
+        f.write('      ' + 'end\n')
+    f.write('   endcase\n')
+    f.write('end\n\n')
+
+def write_verilog_footer(f: TextIO) -> None:
+    f.write('endmodule:ctrl\n\n')
+    f.write('//| Enjoy!                                       |//\n')
@@ -0,0 +1,87 @@
+##################################################################
+#############         cond_analysis.py            ################
+# 1. Per-state analysis of outgoing arch conditions on a BDD ####
+#    over the state's signals: pairwise disjointness and coverage #
+#    of the input space, bounded by a node budget ################
+# 2. Overlap and coverage reports with an example input vector ###
+##################################################################
+
+# imports:
+from typing import Dict, List, Tuple
+from library.base_classes import input, state, arch
+from library.bdd import BDD_FALSE, BDD_TRUE, MAX_BDD_NODES, bdd_manager, bdd_overflow, cond_2_bdd, get_compared_pairs
+from library.cond_compare import _get_support
+
+# Analysis result class of a single state:
+class state_conds:
+    __slots__ = ('name', 'analyzed', 'disjoint', 'complete', 'uncovered', 'overlaps')
+    def __init__(self, name: str) -> None:
+        self.name     = name  # source state name
+        self.analyzed = True  # TRUE / FALSE: the BDDs fit the node budget, otherwise the conditions are assumed to overlap
+        self.disjoint = True  # TRUE / FALSE: at most one outgoing condition is met for any input vector
+        self.complete = False # TRUE / FALSE: some outgoing condition is met for every input vector
+        self.uncovered = None # example input vector meeting no outgoing condition, None if complete or not analyzed
+        self.overlaps = []    # (arch, arch, example input vector) of every overlapping pair, first arch has priority
+
+# Returns a state_conds instance per state name with outgoing archs, 'state_archs' maps state name -> archs in priority order
+# Each state gets its own BDD over the signals of its conditions, a state's conditions are disjoint iff each one misses
+# the union of the previous ones, so pairs are only compared for states that overlap
+# A state whose BDDs outgrow 'max_nodes' is reported as not analyzed and not disjoint, it keeps its priority chain
+def analyze_state_conds(inputs: List[type[input]], states: List[type[state]], state_archs: Dict[str, List[type[arch]]],
+                        max_nodes: int=MAX_BDD_NODES) -> Dict[str, state_conds]:
+    sig_dict = {}
+    for i in inputs:
+        sig_dict[i.name] = i
+    reports = {}
+    for s in states:
+        archs = state_archs.get(s.name, [])
+        if not archs:
+            continue
+        report = state_conds(s.name)
+        try:
+            _analyze_state(report, archs, inputs, sig_dict, max_nodes)
+        except bdd_overflow:
+            report = state_conds(s.name)
+            report.analyzed = False
+            report.disjoint = False
+        reports[s.name] = report
+    return reports
+
+# Fill 'report' with the disjointness, coverage and overlaps of 'archs', the outgoing archs of a single state
+def _analyze_state(report: type[state_conds], archs: List[type[arch]], inputs: List[type[input]], sig_dict: Dict[str, type[input]],
+                   max_nodes: int) -> None:
+    support = set()
+    for a in archs:
+        support |= _get_support(a.cond)
+    m = bdd_manager([i for i in inputs if i.name in support], get_compared_pairs([a.cond for a in archs], sig_dict), max_nodes)
+    nodes = {} # condition class -> BDD node
+    conds = []
+    for a in archs:
+        if a.index not in nodes or a.index == 0: # index 0: not united
+            nodes[a.index] = cond_2_bdd(a.cond, m)
+        conds.append(nodes[a.index])
+    union = BDD_FALSE
+    for c in conds:
+        if m.bdd_and(union, c) != BDD_FALSE:
+            report.disjoint = False
+        union = m.bdd_or(union, c)
+    report.complete = union == BDD_TRUE
+    report.uncovered = m.get_sat(m.bdd_not(union))
+    if not report.disjoint:
+        for i in range(len(conds)):
+            for j in range(i + 1, len(conds)):
+                both = m.bdd_and(conds[i], conds[j])
+                if both != BDD_FALSE:
+                    report.overlaps.append((archs[i], archs[j], m.get_sat(both)))
+
+# Returns a one line description of an overlap reported by analyze_state_conds
+def overlap_2_str(overlap: Tuple[type[arch], type[arch], Dict[str, int]]) -> str:
+    (a0, a1, example) = overlap
+    values = ', '.join([n + '=' + str(v) for n, v in example.items()])
+    return ('conditions of %s -> %s and %s -> %s overlap, e.g. for %s, %s -> %s takes priority'
+            % (a0.source.name, a0.dest.name, a1.source.name, a1.dest.name, values, a0.source.name, a0.dest.name))
+
+# Returns a one line description of the inputs of an incomplete state reported by analyze_state_conds
+def uncovered_2_str(report: type[state_conds]) -> str:
+    values = ', '.join([n + '=' + str(v) for n, v in report.uncovered.items()])
+    return 'no outgoing condition of %s is met for e.g. %s, it stays in %s' % (report.name, values, report.name)
@@ -1,143 +1,206 @@
 ##################################################################
 #############         cond_compare.py                #############
-# 1. Recursive function that drill bool_parser return values #####
-#    and find if a condition is met for a given set of inputs ####
-# 2. Wrapper functions to find if 2 conditions are equivalent ####
-#    for any possible set of inputs ##############################
-# 3. Wrapper functions to unite equivalent conditions in archs ###
+# 1. Enumeration of all values of a signal list, in chunks ########
+# 2. Canonical condition signatures: truth tables over the real ##
+#    support of a condition, or BDD fingerprints #################
+# 3. Wrapper functions to unite equivalent conditions in archs, ##
+#    symbolic (BDD) or exhaustive reference mode #################
 ##################################################################
 
 # imports:
-from typing import List, Tuple
-import itertools
-from boolean_parser.actions.boolean import BoolNot, BoolAnd, BoolOr
-from boolean_parser.actions.clause import Condition
-from rocon.base_classes import input, output, arch
-from rocon.str_manipulation import is_met_comp, is_met_lop
+from typing import Dict, Iterator, List, Set
+from math import prod
+import numpy as np
+from library.cond_parser import Condition, BoolNot, BoolAnd, BoolOr
+from library.base_classes import input, output, arch
+from library.cond_compiler import get_sig_cols, compile_cond
+from library.bdd import bdd_manager, bdd_overflow, cond_2_bdd, get_bdd_fingerprint, get_compared_pairs
+from library.equiv_cache import equiv_cache
+from library.profiling import fsm_stats
 
-# Recursive function, bool return value indicates that recieved condition is met:
-def _check_cond_dig(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr],
-                     sigs: List[type[input]]|List[type[output]], values: List[int], truth: bool=False, ignore: bool=False) -> Tuple[bool, bool]:
-    if (isinstance(cond, Condition)): # Stopping condition
-        for i, s in enumerate(sigs):
-            if s.name == cond.name:
-                if cond.value.isdigit():
-                    bottom_truth = is_met_comp(values[i], cond.operator, int(cond.value))
-                    return (bottom_truth and truth, False)
-                else: # Signal is not comapred to a number but to some unknown value
-                    return (truth, True)
-    elif isinstance(cond, BoolNot): # Parse BoolNot
-        (ds_truth, ds_ignore) = _check_cond_dig(cond.conditions[0], sigs, values, truth)
-        if ds_ignore:
-            return (True, False)
-        else:
-            return (ds_truth, False)
-    else: # Parse BoolAnd or BoolOr
-        (lhs_truth, lhs_ignore) = _check_cond_dig(cond.conditions[0], sigs, values, truth)
-        (rhs_truth, rhs_ignore) = _check_cond_dig(cond.conditions[1], sigs, values, truth)
-        if lhs_ignore and rhs_ignore:
-            return (is_met_lop(True, cond.logicop, True), False)
-        elif lhs_ignore and not rhs_ignore:
-            return (is_met_lop(True, cond.logicop, rhs_truth), False)
-        elif not lhs_ignore and rhs_ignore:
-            return (is_met_lop(lhs_truth, cond.logicop, True), False)
-        else:
-            return (is_met_lop(lhs_truth, cond.logicop, rhs_truth), False)
+_CHUNK_SIZE = 1 << 16 # Input vectors evaluated per batch
+MAX_EXHAUSTIVE_BITS = 24 # Support width bound of exhaustive mode, its truth tables take 2^bits bytes while reduced
 
-# Recursive function, bool return value indicates that recieved condition is met:
-def _check_cond_str(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr],
-                     sigs: List[type[input]]|List[type[output]], values: List[str], truth: bool=False, ignore: bool=False) -> Tuple[bool, bool]:
+# Returns the names of all signals referenced by 'cond', on either side of its comparisons
+def _get_support(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr]) -> Set[str]:
     if (isinstance(cond, Condition)): # Stopping condition
-        for i, s in enumerate(sigs):
-            if s.name == cond.name:
-                if cond.value.isdigit(): # This is checked in _dig twin function
-                    return (truth, True)
-                else: # Signal is not comapred to a number but to some input signal
-                    bottom_truth = is_met_comp(values[i], cond.operator, cond.value)
-                    return (bottom_truth and truth, False)
-    elif isinstance(cond, BoolNot): # Parse BoolNot
-        (ds_truth, ds_ignore) = _check_cond_str(cond.conditions[0], sigs, values, truth)
-        if ds_ignore:
-            return (True, False)
+        if cond.value.isdigit():
+            return {cond.name}
         else:
-            return (ds_truth, False)
-    else: # Parse BoolAnd or BoolOr
-        (lhs_truth, lhs_ignore) = _check_cond_str(cond.conditions[0], sigs, values, truth)
-        (rhs_truth, rhs_ignore) = _check_cond_str(cond.conditions[1], sigs, values, truth)
-        if lhs_ignore and rhs_ignore:
-            return (is_met_lop(True, cond.logicop, True), False)
-        elif lhs_ignore and not rhs_ignore:
-            return (is_met_lop(True, cond.logicop, rhs_truth), False)
-        elif not lhs_ignore and rhs_ignore:
-            return (is_met_lop(lhs_truth, cond.logicop, True), False)
-        else:
-            return (is_met_lop(lhs_truth, cond.logicop, rhs_truth), False)
-
-# Checks if cond1 and cond2 are equivalent for a given set of inputs 'sigs' assigned a given set of values 'values'
-def _comp_conds_dig(cond1: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr],
-               cond2: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: List[type[input]], values: List[int]) -> bool:
-    (eq1, _) = _check_cond_dig(cond1, sigs, values)
-    (eq2, _) = _check_cond_dig(cond2, sigs, values)
-    return eq1==eq2
-# Checks if cond1 and cond2 are equivalent for a given set of inputs 'sigs' assigned a given set of input signal names
-def _comp_conds_str(cond1: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr],
-               cond2: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: List[type[input]], values: List[str]) -> bool:
-    (eq1, _) = _check_cond_str(cond1, sigs, values)
-    (eq2, _) = _check_cond_str(cond2, sigs, values)
-    return eq1==eq2
+            return {cond.name, cond.value}
+    else: # Parse BoolNot, BoolAnd or BoolOr
+        support = set()
+        for c in cond.conditions:
+            support |= _get_support(c)
+        return support
 
-# Returns a list of lists of ints containing all possible permutations of input list 'sigs'
-def _get_permuatations_dig(sigs: List[type[input]]) -> List[List[int]]:
-    biggest = 0
-    max_val_list = []
+# Yields chunks of all possible values of input list 'sigs', one input vector per row, each signal within its own width
+def _get_permuatations_dig(sigs: List[type[input]], chunk_size: int=_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    ranges = []
     for sig in sigs:
-        curr_max = int(pow(2, sig.width))
-        max_val_list.append(curr_max-1)
-        if biggest < curr_max:
-            biggest = curr_max
-    # Get all possible permutations, disregarding signal width:
-    full_list = list(map(list, itertools.product(range(biggest), repeat=len(sigs)))) 
-    # Append to better_list only items which are possible with regards to each signal's width
-    better_list = []
-    for i in range(len(full_list)):
-        okay = True
-        for s in range(len(sigs)):
-            if full_list[i][s] > max_val_list[s]: # Exists an int in the current permutation which is too big
-                okay = False
-        if okay:
-            better_list.append(full_list[i]) # If none violating elements found, append current to better_list
-    return better_list
+        ranges.append(1 << sig.width)
+    total = prod(ranges)
+    for start in range(0, total, chunk_size):
+        flat = np.arange(start, min(start + chunk_size, total), dtype=np.int64)
+        chunk = np.empty((len(flat), len(sigs)), dtype=np.int64)
+        for i in range(len(sigs)-1, -1, -1): # Mixed-radix decode, last signal changes fastest
+            chunk[:, i] = flat % ranges[i]
+            flat //= ranges[i]
+        yield chunk
 
-# Return all permutations of signal names list
-def _get_permutations_str(sigs: List[type[input]]) -> List[List[str]]:
-    names = []
-    for s in sigs:
-        names.append(s.name)
-    return list(itertools.permutations(names))
+# Returns the canonical exhaustive signature of 'cond': its real support (the signals its result depends on, by name, with
+# widths) and the truth-table bitmask over those signals only. Only the signals 'cond' references are enumerated, and
+# equivalent conditions over different signal sets get equal signatures
+# 'fn' evaluates 'cond' on input matrices with a column per signal of 'cols' (e.g. arch.cond_fn), compiled here if None
+# The whole table is kept to find the real support, so conditions over more than MAX_EXHAUSTIVE_BITS input bits raise a ValueError
+def _get_truth_table(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sig_dict: Dict[str, type[input]],
+                     fn=None, cols: Dict[str, int]=None) -> tuple:
+    sigs = sorted([sig_dict[n] for n in _get_support(cond)], key=lambda s: s.name)
+    bits = sum([s.width for s in sigs])
+    if bits > MAX_EXHAUSTIVE_BITS:
+        raise ValueError('exhaustive compare of %r needs 2^%d input vectors, more than 2^%d, use the bdd mode' % (cond, bits, MAX_EXHAUSTIVE_BITS))
+    if fn is None:
+        fn, cols = compile_cond(cond, get_sig_cols(sigs), batched=True), get_sig_cols(sigs)
+    sig_cols = [cols[s.name] for s in sigs]
+    parts = []
+    for chunk in _get_permuatations_dig(sigs): # Streamed chunks, last signal changes fastest
+        vectors = np.zeros((len(chunk), len(cols)), dtype=np.int64) # Signals outside the support do not matter
+        vectors[:, sig_cols] = chunk
+        parts.append(fn(vectors))
+    table = np.concatenate(parts)
+    table = table.reshape([1 << s.width for s in sigs])
+    for axis in range(len(sigs)-1, -1, -1): # Drop signals the result does not depend on
+        first = table.take([0], axis=axis)
+        if np.array_equal(np.broadcast_to(first, table.shape), table):
+            table = first.squeeze(axis=axis)
+            sigs = sigs[:axis] + sigs[axis+1:]
+    return tuple([(s.name, s.width) for s in sigs]), np.packbits(table.ravel()).tobytes()
 
-# Wrapper function to compare 'cond1' and 'cond2' for all possible inputs
-def _comp_conds_wrapper(cond1: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr],
-                       cond2: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sigs: List[type[input]]) -> bool:
-    permutations_dig = _get_permuatations_dig(sigs) # Returns all possible input values
-    permutations_str = _get_permutations_str(sigs) # Return all permutations of input signal names
-    equal = True
-    for perm in permutations_dig: # for each set of possible inputs, check if conditions are equal:
-        if not _comp_conds_dig(cond1, cond2, sigs, perm):
-            equal = False
-    for perm in permutations_str:
-        if not _comp_conds_str(cond1, cond2, sigs, perm):
-            equal = False
-    return equal
+# Returns the persistent cache key of 'cond': canonical condition text plus the widths of the signals it references
+def _get_cache_key(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], sig_dict: Dict[str, type[input]]) -> str:
+    return repr(cond) + '|' + ','.join([n + ':' + str(sig_dict[n].width) for n in sorted(_get_support(cond))])
 
-# Iterate over all conditions in arch_list, assign different ascending indices to different conditions
-def unite_conds(arch_list: List[type[arch]], input_list: List[type[input]])->List[type[arch]]:
+# Returns the run-independent BDD fingerprint of each arch condition, looked up in / added to persistent 'cache'
+# 'memo' (cache key -> fingerprint), if given, is filled for reunite_conds
+def _get_cached_signatures(arch_list: List[type[arch]], input_list: List[type[input]], cache: type[equiv_cache], memo: Dict[str, str]=None) -> List[str]:
+    sig_dict = {}
+    for s in input_list:
+        sig_dict[s.name] = s
+    keys = [_get_cache_key(a.cond, sig_dict) for a in arch_list]
+    found = cache.get_fingerprints(list(dict.fromkeys(keys)))
+    new_items = []
+    for a, key in zip(arch_list, keys):
+        if key not in found: # Fingerprint only the signals the condition references
+            found[key] = get_bdd_fingerprint(a.cond, [sig_dict[n] for n in _get_support(a.cond)])
+            new_items.append((key, found[key]))
+    cache.put_fingerprints(new_items)
+    if memo is not None:
+        for key in keys:
+            memo[key] = found[key]
+    return [found[key] for key in keys]
+
+# Label unlabeled archs with ascending condition indices in order of first appearance, equal 'signatures' share an index
+# Returns signature -> index
+def _label_conds(arch_list: List[type[arch]], signatures: list) -> Dict[object, int]:
     index = 1
-    for a1 in arch_list:
-        if a1.index == 0 : # arch is still unlabeled
-            a1.index = index # label with current index
+    classes = {} # signature -> index of first arch with an equivalent condition
+    for a, key in zip(arch_list, signatures):
+        if a.index != 0: # arch is already labeled, equivalent archs inherit its index
+            classes.setdefault(key, a.index)
+        elif key in classes: # equivalent to a previous condition
+            a.index = classes[key]
+        else: # arch is still unlabeled, label with current index
+            a.index = index
+            classes[key] = index
             index += 1 
-        for a2 in arch_list: # go over all other archs, label with same index if conditions are equivalent
-            if a2.index==0:
-                if _comp_conds_wrapper(a1.cond, a2.cond, input_list):
-                    a2.index = a1.index
-    return arch_list
\ No newline at end of file
+    return classes
+
+# Iterate over all conditions in arch_list, assign different ascending indices to different conditions
+# 'mode' selects the equivalence engine: 'bdd' (symbolic) or 'exhaustive' (reference, evaluates every input vector through
+# arch.cond_fn, archs must be bound to 'input_list' or to no interface, conditions are limited to MAX_EXHAUSTIVE_BITS input bits)
+# Each condition is reduced to a canonical signature (BDD node id or truth table over its real support) and bucketed by it
+# In 'bdd' mode, a persistent 'cache' replaces node ids with fingerprints that are reused across runs, as does a shared node
+# table outgrowing its budget (library.bdd.MAX_BDD_NODES)
+# Work counters are added to 'stats' (library.profiling.fsm_stats) if given, the fingerprints to 'memo' of reunite_conds if given
+def unite_conds(arch_list: List[type[arch]], input_list: List[type[input]], mode: str='bdd', cache: type[equiv_cache]=None,
+                stats: type[fsm_stats]=None, memo: Dict[str, str]=None)->List[type[arch]]:
+    if mode == 'bdd' and cache is not None:
+        (hits, misses) = (cache.hits, cache.misses)
+        signatures = _get_cached_signatures(arch_list, input_list, cache, memo)
+        if stats is not None:
+            stats.count('equiv_cache_hits', cache.hits - hits)
+            stats.count('equiv_cache_misses', cache.misses - misses)
+    elif mode == 'bdd':
+        sig_dict = {}
+        for s in input_list:
+            sig_dict[s.name] = s
+        m = bdd_manager(input_list, get_compared_pairs([a.cond for a in arch_list], sig_dict)) # Node table shared across the whole arch_list
+        try:
+            signatures = [cond_2_bdd(a.cond, m) for a in arch_list]
+        except bdd_overflow: # Fingerprint each condition in its own table, over its own signals
+            found = {} # cache key -> fingerprint, identical conditions are fingerprinted once
+            signatures = []
+            for a in arch_list:
+                key = _get_cache_key(a.cond, sig_dict)
+                if key not in found:
+                    found[key] = get_bdd_fingerprint(a.cond, [sig_dict[n] for n in _get_support(a.cond)])
+                signatures.append(found[key])
+            if stats is not None:
+                stats.count('bdd_overflows')
+        if stats is not None:
+            stats.count('bdd_nodes', len(m.nodes))
+    elif mode == 'exhaustive':
+        sig_dict = {}
+        for s in input_list:
+            sig_dict[s.name] = s
+        cols = get_sig_cols(input_list)
+        signatures = [_get_truth_table(a.cond, sig_dict, a.cond_fn, cols) for a in arch_list] # Unbound archs are compiled here
+        if stats is not None:
+            stats.count('input_vectors', sum([prod([1 << sig_dict[n].width for n in _get_support(a.cond)]) for a in arch_list]))
+    else:
+        print('compare mode %s not supported yet', mode)
+        exit(2)
+    classes = _label_conds(arch_list, signatures)
+    if stats is not None:
+        stats.count('equivalence_checks', len(arch_list)) # One signature lookup per condition
+        stats.count('condition_classes', len(set(classes.values())))
+    return arch_list
+
+# Relabel all archs of 'arch_list' as unite_conds would, reusing 'memo' (condition cache key -> BDD fingerprint) of a previous call
+# Only conditions not in 'memo' (new ones, or over signals whose width changed) are fingerprinted, through persistent 'cache' if given
+# Fingerprints are canonical, so the classes equal those of any compare mode. 'memo' is pruned to the conditions of 'arch_list'
+# 'texts' (id of parse tree -> (tree, text, sorted support)) saves printing unchanged conditions again
+def reunite_conds(arch_list: List[type[arch]], input_list: List[type[input]], memo: Dict[str, str], cache: type[equiv_cache]=None,
+                  stats: type[fsm_stats]=None, texts: Dict[int, tuple]=None) -> List[type[arch]]:
+    sig_dict = {}
+    for s in input_list:
+        sig_dict[s.name] = s
+    if texts is None:
+        texts = {}
+    keys = []
+    for a in arch_list: # Same key as _get_cache_key
+        if id(a.cond) not in texts: # The tree is kept in the entry, so its id is not reused
+            texts[id(a.cond)] = (a.cond, repr(a.cond), sorted(_get_support(a.cond)))
+        (_, text, support) = texts[id(a.cond)]
+        keys.append(text + '|' + ','.join([n + ':' + str(sig_dict[n].width) for n in support]))
+    new = {} # key -> first arch with a condition missing from memo
+    for a, key in zip(arch_list, keys):
+        if key not in memo:
+            new.setdefault(key, a)
+    if cache is not None:
+        signatures = _get_cached_signatures(list(new.values()), input_list, cache)
+    else:
+        signatures = [get_bdd_fingerprint(a.cond, [sig_dict[n] for n in _get_support(a.cond)]) for a in new.values()]
+    memo.update(zip(new.keys(), signatures))
+    for key in set(memo) - set(keys):
+        del memo[key]
+    if len(texts) > 2 * len(arch_list): # Drop trees of removed archs once they dominate
+        used = set([id(a.cond) for a in arch_list])
+        for i in [i for i in texts if i not in used]:
+            del texts[i]
+    for a in arch_list:
+        a.index = 0
+    _label_conds(arch_list, [memo[key] for key in keys])
+    if stats is not None:
+        stats.count('equivalence_checks', len(new)) # Conditions compared against the existing classes
+    return arch_list
@@ -0,0 +1,108 @@
+##################################################################
+#############         cond_compiler.py            ################
+# 1. Lower parsed conditions and outputs into a flat postfix IR ##
+#    with signal names resolved to indices #######################
+# 2. Generate Python callables from the IR, scalar (input tuple) #
+#    or batched (NumPy matrix, one input vector per row) #########
+##################################################################
+
+# imports:
+from typing import Callable, Dict, List, Tuple
+from library.cond_parser import Condition, BitSelect, BoolNot, BoolAnd, BoolOr
+
+# Generated callables, keyed on generated source so equal conditions share one function:
+_fn_cache = {}
+
+# Returns a dict mapping each signal name to its index in an input tuple (or column in an input matrix)
+def get_sig_cols(sigs: List) -> Dict[str, int]:
+    if hasattr(sigs, 'cols'): # sig_table already holds the mapping
+        return sigs.cols
+    cols = {}
+    for i, s in enumerate(sigs):
+        cols[s.name] = i
+    return cols
+
+# Lower 'cond' into postfix IR, a list of instructions:
+#   ('cmp', op, lhs_index, rhs_index, rhs_const) - rhs_index is None when comparing to rhs_const
+#   ('bit', op, lhs_index, bit, rhs_const) - bit 'bit' of the lhs signal compared to rhs_const
+#   ('not',) / ('and', n) / ('or', n) - combine the top 1 / n results
+def lower_cond(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], cols: Dict[str, int], ir: List[tuple]=None) -> List[tuple]:
+    if ir is None:
+        ir = []
+    if isinstance(cond, BitSelect): # Stopping condition, single bit
+        ir.append(('bit', cond.operator, cols[cond.name], cond.bit, int(cond.value)))
+    elif (isinstance(cond, Condition)): # Stopping condition
+        if cond.value.isdigit():
+            ir.append(('cmp', cond.operator, cols[cond.name], None, int(cond.value)))
+        else: # Signal is compared to another input signal
+            ir.append(('cmp', cond.operator, cols[cond.name], cols[cond.value], None))
+    elif isinstance(cond, BoolNot): # Parse BoolNot
+        lower_cond(cond.conditions[0], cols, ir)
+        ir.append(('not',))
+    else: # Parse BoolAnd or BoolOr
+        for c in cond.conditions:
+            lower_cond(c, cols, ir)
+        ir.append((cond.logicop, len(cond.conditions)))
+    return ir
+
+# Lower 'out' into a list of (output_index, input_index, const) assignments, input_index is None for constants
+def lower_out(out: type[Condition]|type[BoolAnd], out_cols: Dict[str, int], in_cols: Dict[str, int]) -> List[Tuple[int, int, int]]:
+    if (isinstance(out, Condition)): # Stopping condition
+        if out.value.isdigit():
+            return [(out_cols[out.name], None, int(out.value))]
+        else: # Output is assigned an input signal
+            return [(out_cols[out.name], in_cols[out.value], None)]
+    else: # Parse BoolAnd, no BoolOr or BoolNot are allowed in arch.out
+        assigns = []
+        for c in out.conditions:
+            assigns += lower_out(c, out_cols, in_cols)
+        return assigns
+
+# Convert postfix IR to a Python expression over 'v'
+def _ir_2_py(ir: List[tuple], batched: bool) -> str:
+    stack = []
+    for inst in ir:
+        if inst[0] == 'cmp':
+            (_, op, lhs, rhs_index, rhs_const) = inst
+            lhs = 'v[:,%d]' % lhs if batched else 'v[%d]' % lhs
+            if rhs_index is None:
+                rhs = str(rhs_const)
+            else:
+                rhs = 'v[:,%d]' % rhs_index if batched else 'v[%d]' % rhs_index
+            stack.append('(' + lhs + ('==' if op == '=' else op) + rhs + ')')
+        elif inst[0] == 'bit':
+            (_, op, lhs, bit, rhs_const) = inst
+            lhs = 'v[:,%d]' % lhs if batched else 'v[%d]' % lhs
+            stack.append('(((' + lhs + ' >> ' + str(bit) + ') & 1)' + ('==' if op == '=' else op) + str(rhs_const) + ')')
+        elif inst[0] == 'not':
+            stack.append(('(~' if batched else '(not ') + stack.pop() + ')')
+        else: # 'and' / 'or'
+            n = inst[1]
+            args = stack[-n:]
+            del stack[-n:]
+            if batched:
+                join = ' & ' if inst[0] == 'and' else ' | '
+            else:
+                join = ' ' + inst[0] + ' '
+            stack.append('(' + join.join(args) + ')')
+    return stack[0]
+
+# Compile Python lambda source once, share it between all callers
+def _compile_src(src: str) -> Callable:
+    fn = _fn_cache.get(src)
+    if fn is None:
+        fn = eval(compile(src, '<rocon>', 'eval'))
+        _fn_cache[src] = fn
+    return fn
+
+# Returns a callable evaluating 'cond', fn(v) -> bool for an input tuple or a bool vector for an input matrix (batched)
+def compile_cond(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], cols: Dict[str, int], batched: bool=False) -> Callable:
+    return _compile_src('lambda v: ' + _ir_2_py(lower_cond(cond, cols), batched))
+
+# Returns a callable fn(v) -> tuple of all output values for input tuple 'v', or of value vectors / constants for an input matrix (batched)
+# Unassigned outputs keep their defaults, or are None without 'defaults' (an arch leaves them to other archs)
+def compile_out(out: type[Condition]|type[BoolAnd], outputs: List, in_cols: Dict[str, int], batched: bool=False, defaults: bool=True) -> Callable:
+    values = [str(o.default) if defaults else 'None' for o in outputs]
+    for (o, i, const) in lower_out(out, get_sig_cols(outputs), in_cols): # Later assignments win, as in the generated verilog
+        values[o] = str(const) if i is None else ('v[:,%d]' if batched else 'v[%d]') % i
+    return _compile_src('lambda v: (' + ''.join([val + ', ' for val in values]) + ')')
@@ -0,0 +1,155 @@
+##################################################################
+#############         cond_parser.py              ################
+# 1. Node classes of parsed conditions: Condition, BitSelect, ####
+#    BoolNot, BoolAnd, BoolOr ####################################
+# 2. Tokenizer and recursive-descent parser for arch.cond and ####
+#    arch.out strings ############################################
+##################################################################
+
+# imports:
+import re
+from typing import List, Tuple
+
+# Comparison leaf, (name operator value), value is a number or a signal name:
+class Condition:
+    __slots__ = ('name', 'operator', 'value')
+    def __init__(self, name: str, operator: str, value: str) -> None:
+        self.name     = name     # signal name, left hand side
+        self.operator = operator # one of = != < <= > >=
+        self.value    = value    # right hand side, digits or signal name
+
+    def __repr__(self) -> str:
+        return self.name + self.operator + self.value
+
+# Comparison leaf of a single bit of a signal, (name[bit] operator value), built by logic minimization, never parsed:
+class BitSelect(Condition):
+    __slots__ = ('bit',)
+    def __init__(self, name: str, bit: int, operator: str, value: str) -> None:
+        super().__init__(name, operator, value) # 'name' is the whole signal, compared bit is 'bit'
+        self.bit = bit
+
+    def __repr__(self) -> str:
+        return self.name + '[' + str(self.bit) + ']' + self.operator + self.value
+
+# Base class of boolean operations, And and Or are binary, Not is unary:
+class BaseBool:
+    __slots__ = ('conditions',)
+    logicop = None
+    def __init__(self, conditions: List) -> None:
+        self.conditions = conditions # operand nodes
+
+    # Unique names of the signals compared in this clause, in order of appearance:
+    @property
+    def params(self) -> List[str]:
+        params = []
+        for c in self.conditions:
+            for p in (c.params if isinstance(c, BaseBool) else [c.name]):
+                if p not in params:
+                    params.append(p)
+        return params
+
+    def __repr__(self) -> str:
+        return self.logicop + '_(' + ', '.join([repr(c) for c in self.conditions]) + ')'
+
+class BoolNot(BaseBool):
+    __slots__ = ()
+    logicop = 'not'
+
+class BoolAnd(BaseBool):
+    __slots__ = ()
+    logicop = 'and'
+
+class BoolOr(BaseBool):
+    __slots__ = ()
+    logicop = 'or'
+
+_TOKEN_RE = re.compile(r'\s*(?:(?P<num>\d+)|(?P<name>[A-Za-z_]\w*)|(?P<op>==|!=|<=|>=|=|<|>)|(?P<par>[()]))')
+_KEYWORDS = ('and', 'or', 'not')
+
+# Split 'cond_str' into (kind, text, position) tokens, kind is one of num / name / op / par / keyword
+def _tokenize(cond_str: str) -> List[Tuple[str, str, int]]:
+    tokens = []
+    pos = 0
+    end = len(cond_str.rstrip())
+    while pos < end:
+        m = _TOKEN_RE.match(cond_str, pos)
+        if m is None:
+            pos = end - len(cond_str[pos:end].lstrip())
+            raise ValueError('Unexpected character %r at position %d in %r' % (cond_str[pos], pos, cond_str))
+        kind = m.lastgroup
+        text = m.group(kind)
+        start = m.start(kind)
+        if kind == 'name' and text.lower() in _KEYWORDS: # Keywords are case insensitive
+            kind, text = 'keyword', text.lower()
+        tokens.append((kind, text, start))
+        pos = m.end()
+    return tokens
+
+# Recursive-descent parser, precedence is not > and > or, and / or are left associative
+class _parser:
+    def __init__(self, cond_str: str) -> None:
+        self.cond_str = cond_str
+        self.tokens   = _tokenize(cond_str)
+        self.pos      = 0
+
+    def _peek(self) -> Tuple[str, str, int]:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return ('end', '', len(self.cond_str))
+
+    def _next(self, kind: str) -> str:
+        tok = self._peek()
+        if tok[0] != kind:
+            raise ValueError('Expected %s but found %r at position %d in %r' % (kind, tok[1] or 'end of string', tok[2], self.cond_str))
+        self.pos += 1
+        return tok[1]
+
+    def parse(self):
+        node = self._or_expr()
+        tok = self._peek()
+        if tok[0] != 'end':
+            raise ValueError('Unexpected %r at position %d in %r' % (tok[1], tok[2], self.cond_str))
+        return node
+
+    def _or_expr(self):
+        node = self._and_expr()
+        while self._peek()[:2] == ('keyword', 'or'):
+            self.pos += 1
+            node = BoolOr([node, self._and_expr()])
+        return node
+
+    def _and_expr(self):
+        node = self._not_expr()
+        while self._peek()[:2] == ('keyword', 'and'):
+            self.pos += 1
+            node = BoolAnd([node, self._not_expr()])
+        return node
+
+    def _not_expr(self):
+        if self._peek()[:2] == ('keyword', 'not'):
+            self.pos += 1
+            return BoolNot([self._not_expr()])
+        return self._atom()
+
+    def _atom(self):
+        if self._peek()[:2] == ('par', '('):
+            self.pos += 1
+            node = self._or_expr()
+            if self._peek()[:2] != ('par', ')'):
+                tok = self._peek()
+                raise ValueError('Expected \')\' but found %r at position %d in %r' % (tok[1] or 'end of string', tok[2], self.cond_str))
+            self.pos += 1
+            return node
+        name = self._next('name')
+        op = self._next('op')
+        if op == '==':
+            op = '='
+        if self._peek()[0] == 'num':
+            value = self._next('num')
+        else:
+            value = self._next('name')
+        return Condition(name, op, value)
+
+# Parse 'cond_str' into a tree of Condition / BoolNot / BoolAnd / BoolOr nodes
+def parse(cond_str: str):
+    return _parser(cond_str).parse()
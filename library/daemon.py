@@ -0,0 +1,235 @@
+##################################################################
+#############         daemon.py                   ################
+# 1. Long running build server keeping loaded fsms (parsed #######
+#    archs, interfaces, condition indices) in memory #############
+# 2. Source file watching, only changed FSMs are reloaded and ####
+#    their outputs regenerated ###################################
+# 3. Line based command interface on stdin and / or a unix #######
+#    socket, one JSON reply line per command #####################
+##################################################################
+
+# imports:
+import json
+import os
+import selectors
+import socket
+import stat
+import sys
+import time
+import traceback
+from typing import Dict, List, Tuple
+from library.fsm_class import fsm
+from library.batch import get_out_names, get_source_path, prepare_fsm, write_outputs
+
+_POLL_INTERVAL = 0.5 # Seconds between source file checks
+_COMMANDS = ('build', 'reload', 'add', 'remove', 'status', 'quit')
+
+# Watched source class:
+class watched_fsm:
+    __slots__ = ('source', 'path', 'out_dir', 'stamp', 'machine', 'stale', 'error')
+    def __init__(self, source: str, out_dir: str) -> None:
+        self.source  = source                    # FSM source, description file or module:function
+        self.path    = get_source_path(source)   # file watched for changes, None if there is none
+        self.out_dir = out_dir                   # output folder of this FSM
+        self.stamp   = None                      # (mtime, size) of 'path' when last loaded
+        self.machine = None                      # last successfully loaded fsm, kept when a reload fails
+        self.stale   = False                     # TRUE / FALSE: the source changed but failed to load, 'machine' is older
+        self.error   = None                      # traceback of the last failed load or build, None on success
+
+# Returns (mtime, size) of file 'path', None if it does not exist or 'path' is None
+def _get_stamp(path: str) -> Tuple[int, int]:
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# Build server class, options are those of library.batch.prepare_fsm and write_outputs
+class fsm_daemon:
+    def __init__(self, out_folder: str, graph: bool, verilog: bool, graph_opts: dict=None, verilog_opts: dict=None, tb_opts: dict=None,
+                 minimize: bool=False, minimize_conds: bool=False) -> None:
+        self.out_folder     = out_folder
+        self.graph          = graph
+        self.verilog        = verilog
+        self.graph_opts     = graph_opts
+        self.verilog_opts   = verilog_opts
+        self.tb_opts        = tb_opts
+        self.minimize       = minimize
+        self.minimize_conds = minimize_conds
+        self.watched        = {} # source -> watched_fsm, in order of addition
+        self.running        = False
+
+    # Returns the loaded fsm of 'source', None if it never loaded
+    def get_fsm(self, source: str) -> fsm:
+        return self.watched[source].machine
+
+    # (Re)load 'w' if 'reload' or its source changed, then write its outputs, returns a result dict (source, status, ms, error)
+    # status: 'rebuilt' - description reloaded, 'written' - outputs of the loaded fsm written or up to date, 'failed'
+    def _build(self, w: type[watched_fsm], reload: bool, force: bool) -> dict:
+        start = time.perf_counter()
+        status = 'written'
+        try:
+            stamp = _get_stamp(w.path)
+            if reload or w.machine is None or stamp != w.stamp:
+                w.stamp = stamp # Also on failure, a broken file is retried once it changes again
+                w.stale = True
+                w.machine = prepare_fsm(w.source, self.minimize, self.minimize_conds, reload=True)
+                w.stale = False
+                status = 'rebuilt'
+            elif w.stale: # Do not write outputs of an older description
+                return {'source': w.source, 'status': 'failed', 'ms': 0.0, 'error': w.error}
+            write_outputs(w.machine, w.out_dir, self.graph, self.verilog, force, self.graph_opts, self.verilog_opts, self.tb_opts, w.source)
+            w.error = None
+        except (Exception, SystemExit):
+            w.error = traceback.format_exc()
+            status = 'failed'
+        result = {'source': w.source, 'status': status, 'ms': round((time.perf_counter() - start) * 1000, 3)}
+        if w.error is not None:
+            result['error'] = w.error
+        return result
+
+    # Start watching 'sources' and build them, returns a result dict per source
+    def add(self, sources: List[str]) -> List[dict]:
+        results = []
+        for source in sources:
+            if source in self.watched:
+                continue
+            names = get_out_names(list(self.watched) + [source]) # Existing names do not depend on later sources
+            out_dir = '-' if self.out_folder == '-' else os.path.join(self.out_folder, names[-1])
+            self.watched[source] = watched_fsm(source, out_dir)
+            results.append(self._build(self.watched[source], True, False))
+        return results
+
+    # Stop watching 'sources', their outputs are left in place
+    def remove(self, sources: List[str]) -> List[dict]:
+        results = []
+        for source in sources:
+            results.append({'source': source, 'status': 'removed' if self.watched.pop(source, None) else 'unknown'})
+        return results
+
+    # Returns the watched sources whose file changed since they were last loaded
+    def changed(self) -> List[str]:
+        return [s for s, w in self.watched.items() if w.path is not None and _get_stamp(w.path) != w.stamp]
+
+    # Bring 'sources' (all watched ones if None) up to date, loaded fsms whose source did not change are reused
+    # 'reload' reloads them regardless, 'force' regenerates outputs that are up to date
+    def build(self, sources: List[str]=None, reload: bool=False, force: bool=False) -> List[dict]:
+        results = []
+        for source in (list(self.watched) if sources is None else sources):
+            if source not in self.watched:
+                results.append({'source': source, 'status': 'unknown'})
+            else:
+                results.append(self._build(self.watched[source], reload, force))
+        return results
+
+    # Returns source -> (output folder, loaded, stale, last error) of every watched source
+    def status(self) -> Dict[str, dict]:
+        return dict([(s, {'out_dir': w.out_dir, 'loaded': w.machine is not None, 'stale': w.stale, 'error': w.error}) for s, w in self.watched.items()])
+
+    # Execute command line 'line', returns the reply. Commands, SOURCE... defaults to all watched sources:
+    # build [-f] [SOURCE...] - reload changed sources and write outputs, '-f' regenerates up to date outputs
+    # reload [SOURCE...]     - reload sources even if unchanged and write outputs
+    # add SOURCE...          - watch and build new sources
+    # remove SOURCE...       - stop watching sources
+    # status                 - watched sources and their last errors
+    # quit                   - stop serving
+    def handle(self, line: str) -> dict:
+        words = line.split()
+        if not words:
+            return {'ok': False, 'error': 'empty command'}
+        cmd, args = words[0], words[1:]
+        start = time.perf_counter()
+        if cmd == 'build':
+            force = '-f' in args
+            results = self.build([a for a in args if a != '-f'] or None, force=force)
+        elif cmd == 'reload':
+            results = self.build(args or None, reload=True)
+        elif cmd == 'add':
+            results = self.add(args)
+        elif cmd == 'remove':
+            results = self.remove(args)
+        elif cmd == 'status':
+            return {'ok': True, 'sources': self.status()}
+        elif cmd == 'quit':
+            self.running = False
+            return {'ok': True}
+        else:
+            return {'ok': False, 'error': 'unknown command %r, expected one of %s' % (cmd, ', '.join(_COMMANDS))}
+        ok = all([r['status'] not in ('failed', 'unknown') for r in results])
+        return {'ok': ok, 'ms': round((time.perf_counter() - start) * 1000, 3), 'results': results}
+
+    # Serve commands from stdin and / or unix socket 'socket_path' until 'quit', source files are watched after the end of inputs
+    # Every 'interval' seconds without commands, changed sources are rebuilt and reported on stderr (None disables watching)
+    def serve(self, use_stdin: bool=True, socket_path: str=None, interval: float=_POLL_INTERVAL) -> None:
+        sel = selectors.DefaultSelector()
+        server = None
+        if use_stdin:
+            try:
+                sel.register(sys.stdin.fileno(), selectors.EVENT_READ, (sys.stdin.fileno(), self._reply_stdout, bytearray()))
+            except (OSError, ValueError): # /dev/null or a regular file can not be polled
+                print('stdin can not be polled, not reading commands from it', file=sys.stderr)
+        if socket_path is not None:
+            if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode): # Left over by a previous server
+                os.unlink(socket_path)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(socket_path)
+            server.listen()
+            server.setblocking(False)
+            sel.register(server, selectors.EVENT_READ, None)
+        self.running = True
+        try:
+            while self.running:
+                if sel.get_map():
+                    events = sel.select(interval)
+                elif interval is None: # Nothing to watch and no command channel left
+                    break
+                else: # Watching files only
+                    time.sleep(interval)
+                    events = []
+                if not events and interval is not None:
+                    for r in self.build(self.changed()):
+                        print('%-7s %s (%.1f ms)' % (r['status'], r['source'], r['ms']), file=sys.stderr)
+                        if 'error' in r:
+                            print(r['error'], file=sys.stderr)
+                for key, _ in events:
+                    if key.data is None: # New socket client
+                        conn, _ = server.accept()
+                        conn.setblocking(True) # Replies are short, send them whole
+                        sel.register(conn, selectors.EVENT_READ, (conn, conn.sendall, bytearray()))
+                    else:
+                        self._read(sel, key.fileobj, *key.data)
+                    if not self.running:
+                        break
+        finally:
+            for key in list(sel.get_map().values()):
+                if isinstance(key.fileobj, socket.socket):
+                    key.fileobj.close()
+            sel.close()
+            if server is not None:
+                os.unlink(socket_path)
+
+    # Read available bytes of a command channel, execute its complete lines and close it at end of input
+    def _read(self, sel, fileobj, channel, reply, buf: bytearray) -> None:
+        try:
+            data = channel.recv(65536) if isinstance(channel, socket.socket) else os.read(channel, 65536)
+        except OSError: # Connection reset, handled as end of input
+            data = b''
+        if not data:
+            sel.unregister(fileobj)
+            if isinstance(channel, socket.socket):
+                channel.close()
+            return
+        buf += data
+        while b'\n' in buf and self.running:
+            line, _, rest = bytes(buf).partition(b'\n')
+            buf[:] = rest
+            try:
+                reply((json.dumps(self.handle(line.decode())) + '\n').encode())
+            except OSError: # Client went away
+                return
+
+    def _reply_stdout(self, data: bytes) -> None:
+        sys.stdout.write(data.decode())
+        sys.stdout.flush()
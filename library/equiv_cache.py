@@ -0,0 +1,98 @@
+##################################################################
+#############         equiv_cache.py              ################
+# 1. Persistent SQLite store of condition fingerprints, keyed ####
+#    on canonical condition text and involved signal widths ######
+# 2. Process-wide default cache used by unite_conds ##############
+##################################################################
+
+# imports:
+import os
+import sqlite3
+import time
+from typing import Dict, List, Tuple
+
+_MAX_ENTRIES = 100000 # Default size bound, least recently used entries are evicted beyond it
+
+# Returns the default cache file location, under $XDG_CACHE_HOME or ~/.cache
+def get_default_cache_path() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'rocon', 'equiv_cache.sqlite')
+
+# Condition fingerprint cache class, safe to share between parallel build processes:
+class equiv_cache:
+    def __init__(self, path: str, max_entries: int=_MAX_ENTRIES) -> None:
+        self.path        = path        # SQLite file
+        self.max_entries = max_entries # size bound
+        self.hits        = 0
+        self.misses      = 0
+        self._conn       = None
+        self._pid        = None
+
+    # Open lazily, once per process, connections must not cross a fork
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._pid = os.getpid()
+            self._conn.execute('PRAGMA journal_mode=WAL') # Readers do not block the writer
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS fingerprints (key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, last_used REAL NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS fingerprints_last_used ON fingerprints (last_used)')
+        return self._conn
+
+    # Returns a dict key -> fingerprint for the cached subset of 'keys', and marks them as recently used
+    def get_fingerprints(self, keys: List[str]) -> Dict[str, str]:
+        conn = self._get_conn()
+        found = {}
+        for start in range(0, len(keys), 500): # Stay below SQLite's bound variable limit
+            chunk = keys[start:start + 500]
+            rows = conn.execute('SELECT key, fingerprint FROM fingerprints WHERE key IN (%s)' % ','.join('?' * len(chunk)), chunk)
+            found.update(rows.fetchall())
+        if found:
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('UPDATE fingerprints SET last_used = ? WHERE key = ?', [(now, k) for k in found])
+            conn.execute('COMMIT')
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    # Store (key, fingerprint) pairs, then evict least recently used entries beyond max_entries
+    def put_fingerprints(self, items: List[Tuple[str, str]]) -> None:
+        if not items:
+            return
+        conn = self._get_conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE') # Serializes writers across processes
+        conn.executemany('INSERT OR REPLACE INTO fingerprints (key, fingerprint, last_used) VALUES (?, ?, ?)', [(k, f, now) for k, f in items])
+        excess = conn.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute('DELETE FROM fingerprints WHERE key IN (SELECT key FROM fingerprints ORDER BY last_used LIMIT ?)', (excess,))
+        conn.execute('COMMIT')
+
+    def clear(self) -> None:
+        conn = self._get_conn()
+        conn.execute('DELETE FROM fingerprints')
+
+    def close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+# Delete cache file 'path' and its SQLite journal files, if they exist, without opening the database
+def remove_cache_file(path: str) -> None:
+    for p in [path, path + '-wal', path + '-shm', path + '-journal']:
+        if os.path.exists(p):
+            os.remove(p)
+
+_default_cache = None
+
+# Set the process-wide cache used by unite_conds, None disables it
+def set_default_equiv_cache(path: str=None, max_entries: int=_MAX_ENTRIES) -> None:
+    global _default_cache
+    if _default_cache is not None:
+        _default_cache.close()
+    _default_cache = None if path is None else equiv_cache(path, max_entries)
+
+def get_default_equiv_cache() -> equiv_cache:
+    return _default_cache
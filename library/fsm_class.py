@@ -5,22 +5,58 @@
 ##################################################################
 
 # imports:
-from typing import List, Tuple
+from typing import Dict, List, TextIO, Tuple
+import os
+import sys
 import graphviz
 from library.base_classes import input, output, state, arch
-from library.build_graph import cond_2_g, out_2_g_wrapper
-from library.build_verilog import get_verilog_header, get_verilog_footer, get_verilog_enum, get_verilog_interface, get_verilog_ns_logic, get_verilog_out_logic
-from library.inferring import get_fsm_interface, get_fsm_states
-from library.cond_compare import unite_conds
+from library.build_graph import get_fsm_graph, get_state_graph, render_gv_files
+from library.build_verilog import write_verilog_header, write_verilog_footer, write_verilog_enum, write_verilog_interface, write_verilog_ns_logic, write_verilog_out_logic
+from library.build_verilog import write_verilog_encoded_enum, write_verilog_onehot_enum, write_verilog_onehot_ns_logic, write_verilog_onehot_out_logic
+from library.inferring import _sig_summary, get_fsm_interfaces, get_summary_interfaces, get_fsm_states, get_state_archs
+from library.cond_compare import unite_conds, reunite_conds
+from library.equiv_cache import get_default_equiv_cache
+from library.rebuild_cache import get_fsm_digest, is_up_to_date, record_outputs
+from library.simulator import fsm_simulator
+from library.build_testbench import get_random_stimulus, write_vectors, write_testbench
+from library.minimize import merge_states
+from library.state_encoding import get_state_encoding
+from library.cond_analysis import state_conds, analyze_state_conds, overlap_2_str, uncovered_2_str
+from library.logic_min import minimize_conds
+from library.profiling import fsm_stats, stage, get_default_profile, get_default_profile_hook
 
 # FSM class:
 class fsm:
-    def __init__(self, arch_list: List[arch], default_state=None, clock=None, reset=None) -> None:
-        self.graph     = graphviz.Digraph('FSM', filename='fsm.gv') # Create an empty directed graphviz graph
-        self.inputs    = get_fsm_interface(arch_list)
-        self.outputs   = get_fsm_interface(arch_list, get_out=True) 
-        self.arch_list = unite_conds(arch_list, self.inputs)
-        self.default_state, self.states = get_fsm_states(self.arch_list, default_state)
+    def __init__(self, arch_list: List[arch], default_state=None, clock=None, reset=None, compare_mode='bdd',
+                 profile: bool=None, profile_hook=None, minimize: bool=False) -> None:
+        self.graph     = None # Graphviz graph of the last build, rebuilt from scratch every time
+        self.compare_mode = compare_mode
+        self._default_name = default_state # Default state name as given, kept for arch mutations
+        self._sigs = None # Signal summary of arch_list, built by the first arch mutation
+        self._cond_memo = {} # Condition cache key -> fingerprint, filled by a cached unite_conds or arch mutations
+        self._cond_texts = {} # Parse tree id -> (tree, text, support) of the conditions seen by arch mutations
+        self._minimize = False # TRUE / FALSE: states were merged, arch mutations merge them again
+        self._min_memo = None # Minimized condition memo and bit limit of minimize_conds
+        self._min_bits = None
+        if profile is None: # Follow the process-wide setting
+            profile = get_default_profile()
+            profile_hook = profile_hook or get_default_profile_hook()
+        self.stats     = fsm_stats(profile_hook) if profile or profile_hook is not None else None # Per-stage profile, None if disabled
+        with stage(self.stats, 'get_fsm_interfaces'):
+            self.inputs, self.outputs = get_fsm_interfaces(arch_list)
+        if self.stats is not None:
+            self.stats.count('archs', len(arch_list))
+            self.stats.count('input_bits', sum([i.width for i in self.inputs])) # log2 of the input space size
+        for a in arch_list: # Conditions and outputs are compiled on first use of cond_fn / out_fn
+            a.bind(self.inputs, self.outputs)
+        with stage(self.stats, 'unite_conds'): # Own copy of arch_list, changed by the arch mutations below
+            self.arch_list = unite_conds(list(arch_list), self.inputs, compare_mode, get_default_equiv_cache(), self.stats, self._cond_memo)
+        with stage(self.stats, 'get_fsm_states'):
+            self.default_state, self.states = get_fsm_states(self.arch_list, default_state)
+        self.merged_states = {} # kept state name -> names of the equivalent states merged into it
+        self.min_conds = None # condition class -> minimized sum-of-products tree emitted by the backends, see minimize_conds
+        if minimize:
+            self.minimize()
         if clock is None:
             self.clock     = input('clk', 1)
         else:
@@ -30,43 +66,262 @@ class fsm:
         else:
             self.reset     = input(reset, 1)
 
-    # This functions builds self.graph using self.statets_list and self.edges_dict
-    def build_graph(self, path) -> None:
-        # Add entry:
-        self.graph.node('', shape='point')
-        self.graph.edge('', self.default_state.name, '!'+self.reset.name)
-        # Add nodes:
-        for state in self.states:
-            self.graph.node(state.name)
-        # Add edges:
-        index_list, legend = [], 'Transitions:\n'
-        for arch in self.arch_list:
-            self.graph.edge(arch.source.name, arch.dest.name, (str(arch.index) + '\n' + out_2_g_wrapper(arch.out, self.outputs)))
-            if arch.index not in index_list:
-                index_list.append(arch.index)
-                legend += str(arch.index) + ' --> ' + cond_2_g(arch.cond, self.inputs) + '\n'
-        legend += '\nOutputs:\n{'
-        for o in self.outputs:
-            legend += o.name + ', '
-        legend = legend[:-2] + '}'
-        self.graph.node(legend, shape='box')
-        # Render graph
-        self.graph.render(path + '/ctrl.gv').replace('\\', '/')
-
-    def build_verilog(self, path) -> None:
-        code = ''
+    # Merge equivalent states (same united conditions, outputs and equivalent dest states, in the same priority order)
+    # The interface is re-derived from the remaining archs, signals only used by merged states are dropped. If it changed,
+    # conditions are compared again over the new widths and merged again, until nothing changes
+    # Returns kept state name -> names of the states merged into it, also accumulated in self.merged_states
+    def minimize(self) -> Dict[str, List[str]]:
+        merged = {}
+        with stage(self.stats, 'minimize'):
+            while True:
+                self.states, self.arch_list, step = merge_states(self.default_state, self.states, self.arch_list)
+                merged.update(step)
+                if not step:
+                    break
+                inputs, outputs = get_fsm_interfaces(self.arch_list)
+                if ([(i.name, i.width) for i in inputs] == [(i.name, i.width) for i in self.inputs] and
+                    [(o.name, o.width, o.default) for o in outputs] == [(o.name, o.width, o.default) for o in self.outputs]):
+                    break
+                self.inputs, self.outputs = inputs, outputs
+                for a in self.arch_list: # Compiled functions depend on signal positions and widths
+                    a.bind(self.inputs, self.outputs)
+                cache = get_default_equiv_cache() if self.compare_mode == 'bdd' else None
+                reunite_conds(self.arch_list, self.inputs, self._cond_memo, cache, self.stats, self._cond_texts)
+                if self.min_conds is not None:
+                    self.min_conds = minimize_conds(self.arch_list, self.inputs, self._min_bits, self._min_memo)
+        self._sigs = None # Archs of merged states are gone
+        self._minimize = True
+        for name, names in merged.items():
+            self.merged_states.setdefault(name, []).extend(names)
+        if self.stats is not None:
+            self.stats.count('merged_states', sum([len(names) for names in merged.values()]))
+        return merged
+
+    # Reduce every condition class to a minimal sum-of-products over the bits of its signals (Quine-McCluskey)
+    # Both backends emit the minimized forms, conditions over more than 'max_bits' input bits, or not made smaller, keep their form
+    # Returns condition class -> emitted tree, also kept in self.min_conds
+    def minimize_conds(self, max_bits: int=10) -> Dict[int, object]:
+        with stage(self.stats, 'minimize_conds'):
+            self._min_memo, self._min_bits = {}, max_bits
+            self.min_conds = minimize_conds(self.arch_list, self.inputs, max_bits, self._min_memo)
+        return self.min_conds
+
+    # Arch mutations below leave the fsm equal to fsm(self.arch_list) built from scratch with the same settings: interface,
+    # condition indices, states, compiled functions and minimized conditions. An fsm minimized once merges its equivalent states
+    # again after each mutation, merged_states accumulates the merges of all of them
+    # Only conditions not seen before, or over signals whose width changed, are compared against the existing condition classes
+
+    # Insert arch 'a' at position 'pos' of arch_list, appended if None, returns 'a'
+    def add_arch(self, a: arch, pos: int=None) -> arch:
+        with stage(self.stats, 'add_arch'):
+            appended = pos is None or pos >= len(self.arch_list)
+            if appended:
+                self.arch_list.append(a)
+            else:
+                self.arch_list.insert(pos, a)
+            self._update([a], appended)
+        return a
+
+    # Remove arch 'a', an arch of arch_list or its position, returns the removed arch
+    def remove_arch(self, a: arch|int) -> arch:
+        with stage(self.stats, 'remove_arch'):
+            pos = self._get_arch_pos(a)
+            if len(self.arch_list) == 1:
+                raise ValueError('can not remove the last arch of an fsm')
+            removed = self.arch_list.pop(pos)
+            self._update([], False)
+        return removed
+
+    # Replace arch 'old', an arch of arch_list or its position, by arch 'new' at the same position, returns the replaced arch
+    def replace_arch(self, old: arch|int, new: arch) -> arch:
+        with stage(self.stats, 'replace_arch'):
+            pos = self._get_arch_pos(old)
+            replaced = self.arch_list[pos]
+            self.arch_list[pos] = new
+            self._update([new], False)
+        return replaced
+
+    # Returns the position in arch_list of 'a', an arch of arch_list or a (possibly negative) position
+    def _get_arch_pos(self, a: arch|int) -> int:
+        if isinstance(a, int):
+            if not -len(self.arch_list) <= a < len(self.arch_list):
+                raise IndexError('arch position %d out of range' % a)
+            return a % len(self.arch_list)
+        for i, b in enumerate(self.arch_list):
+            if b is a:
+                return i
+        raise ValueError('arch is not part of this fsm')
+
+    # Bring everything derived from arch_list up to date after archs 'added' were inserted (appended at its end if 'appended')
+    # and / or others removed. Interface and states are re-derived in linear time, conditions are compared only if new
+    def _update(self, added: List[arch], appended: bool) -> None:
+        if appended and self._sigs is not None: # A full rebuild also summarizes appended archs last
+            for a in added:
+                self._sigs.add_arch(a)
+        else: # Union-find can not undo a removal
+            self._sigs = _sig_summary(self.arch_list)
+        inputs, outputs = get_summary_interfaces(self._sigs)
+        recompile = ([(i.name, i.width) for i in inputs] != [(i.name, i.width) for i in self.inputs] or
+                     [(o.name, o.width, o.default) for o in outputs] != [(o.name, o.width, o.default) for o in self.outputs])
+        if recompile: # Compiled functions of every arch depend on signal positions and widths, bind them again
+            self.inputs, self.outputs = inputs, outputs
+        cache = get_default_equiv_cache() if self.compare_mode == 'bdd' else None
+        reunite_conds(self.arch_list, self.inputs, self._cond_memo, cache, self.stats, self._cond_texts)
+        for a in self.arch_list: # States are interned again from scratch
+            a.source.reset = False
+            a.dest.reset = False
+        self.default_state, self.states = get_fsm_states(self.arch_list, self._default_name)
+        if self._minimize: # A new or changed arch can make states equivalent
+            self.minimize()
+        for a in (self.arch_list if recompile else added):
+            a.bind(self.inputs, self.outputs)
+        if self.min_conds is not None:
+            self.min_conds = minimize_conds(self.arch_list, self.inputs, self._min_bits, self._min_memo)
+
+    # Returns a fresh graphviz graph of the fsm, also kept in self.graph
+    def get_graph(self) -> graphviz.Digraph:
+        self.graph = get_fsm_graph(self.default_state, self.states, self.arch_list, self.reset, self.inputs, self.outputs, self.min_conds)
+        return self.graph
+
+    # Writes the DOT source of the graph to text stream 'f', no Graphviz process is started
+    def write_graph(self, f: TextIO) -> None:
+        f.write(self.get_graph().source)
+
+    # This functions builds ctrl.gv in folder 'path' and renders it to format 'fmt', fmt=None only writes the DOT file
+    # 'split' also writes a ctrl_<state>.gv file per state, all files are rendered by up to 'jobs' concurrent dot processes
+    # Skipped if 'path' holds a graph generated from the same description, unless 'force' is set
+    def build_graph(self, path, force: bool=False, fmt: str='pdf', split: bool=False, jobs: int=1) -> None:
+        if path == '-':
+            self.write_graph(sys.stdout)
+            return
+        digest = get_fsm_digest(self, 'graph', fmt=fmt, split=split)
+        if not force and is_up_to_date(path, 'graph', digest):
+            if self.stats is not None:
+                self.stats.count('graph_builds_skipped')
+            return
+        with stage(self.stats, 'get_graph'):
+            graphs = {'ctrl.gv': self.get_graph()}
+            if split:
+                state_archs = get_state_archs(self.arch_list)
+                for s in [self.default_state] + self.states:
+                    if s.name in state_archs:
+                        graphs['ctrl_' + s.name + '.gv'] = get_state_graph(s, state_archs[s.name], self.inputs, self.outputs, self.min_conds)
+        files = []
+        with stage(self.stats, 'save_graph'):
+            for name, graph in graphs.items():
+                graph.save(os.path.join(path, name))
+                files.append(name)
+        if fmt is not None: # Render graphs
+            with stage(self.stats, 'render_graph'):
+                rendered = render_gv_files([os.path.join(path, name) for name in graphs], fmt, jobs)
+            files += [os.path.basename(r) for r in rendered]
+            if self.stats is not None:
+                self.stats.count('rendered_files', len(rendered))
+        record_outputs(path, 'graph', digest, files)
+
+    # Returns a cycle simulator over dense transition tables, limited to FSMs with up to 'max_input_bits' input bits
+    def get_simulator(self, max_input_bits: int=20) -> fsm_simulator:
+        return fsm_simulator(self, max_input_bits)
+
+    # Returns (state register width, state name -> code) under 'encoding' (see library.state_encoding), (None, None) for 'enum'
+    # 'table' holds the state name -> code table of the 'user' encoding
+    def get_state_encoding(self, encoding: str='enum', table: Dict[str, int]=None) -> Tuple[int, Dict[str, int]]:
+        return get_state_encoding([self.default_state] + self.states, encoding, table)
+
+    # Returns state name -> state_conds (disjointness, coverage and overlaps of its outgoing conditions) for states with archs
+    def analyze_conds(self) -> Dict[str, state_conds]:
+        with stage(self.stats, 'analyze_conds'):
+            return analyze_state_conds(self.inputs, [self.default_state] + self.states, get_state_archs(self.arch_list))
+
+    # Writes the verilog module to text stream 'f' (file, stdout, io.StringIO...) section by section
+    # 'encoding' selects the state encoding: 'enum' (left to synthesis), 'binary', 'gray', 'onehot' or 'user' ('encoding_table')
+    # With 'parallel_case', states with disjoint outgoing conditions get priority-free next-state logic, overlaps and states
+    # whose conditions do not cover every input are reported on stderr
+    # prefixed with 'name' if given (e.g. the source of the fsm in a batch)
+    def write_verilog(self, f: TextIO, encoding: str='enum', encoding_table: Dict[str, int]=None, parallel_case: bool=True, name: str=None) -> None:
+        states = [self.default_state] + self.states
+        state_archs = get_state_archs(self.arch_list) # source state -> archs, built once for both logic blocks
+        width, codes = self.get_state_encoding(encoding, encoding_table)
+        parallel = set()
+        if parallel_case:
+            for s_name, report in self.analyze_conds().items():
+                if report.disjoint:
+                    parallel.add(s_name)
+                if not report.analyzed:
+                    print(('' if name is None else name + ': ') + 'Warning: conditions of state %s are too large to analyze, '
+                          'kept in priority order' % s_name, file=sys.stderr)
+                for overlap in report.overlaps:
+                    print(('' if name is None else name + ': ') + 'Warning: ' + overlap_2_str(overlap), file=sys.stderr)
+                if report.uncovered is not None:
+                    print(('' if name is None else name + ': ') + 'Note: ' + uncovered_2_str(report), file=sys.stderr)
         # 0. Build module header:
-        code += get_verilog_header()
+        write_verilog_header(f)
         # 1. Build moudle interface:
-        code += get_verilog_interface(self.clock, self.reset, self.inputs, self.outputs)
-        # 2. Buile module enum and current state sample:
-        code += get_verilog_enum(self.clock, self.reset, self.default_state, self.states)
-        # 3. Build module next-state logic:
-        code += get_verilog_ns_logic(self.inputs, [self.default_state] + self.states, self.arch_list)
-        # 4. Build module output logic:
-        code += get_verilog_out_logic(self.outputs, [self.default_state] + self.states, self.arch_list)
+        write_verilog_interface(f, self.clock, self.reset, self.inputs, self.outputs)
+        if encoding == 'onehot':
+            # 2. Build state register, one bit per state:
+            write_verilog_onehot_enum(f, self.clock, self.reset, self.default_state, self.states)
+            # 3. Build per-bit next-state equations:
+            write_verilog_onehot_ns_logic(f, self.inputs, states, state_archs, parallel, self.min_conds)
+            # 4. Build output logic on single state bits:
+            write_verilog_onehot_out_logic(f, self.outputs, states, state_archs)
+        else:
+            # 2. Buile module enum and current state sample:
+            if codes is None:
+                write_verilog_enum(f, self.clock, self.reset, self.default_state, self.states)
+            else:
+                write_verilog_encoded_enum(f, self.clock, self.reset, self.default_state, self.states, width, codes)
+            # 3. Build module next-state logic:
+            write_verilog_ns_logic(f, self.inputs, states, state_archs, parallel, self.min_conds)
+            # 4. Build module output logic:
+            write_verilog_out_logic(f, self.outputs, states, state_archs)
         # 5. Build module footer:
-        code += get_verilog_footer()
-        # 6. Write output .sv file:
-        with open(path + '/ctrl.sv', 'w') as f:
-            f.write(code) 
\ No newline at end of file
+        write_verilog_footer(f)
+
+    # Writes output .sv file to folder 'path', or to stdout if path is '-', see write_verilog for 'encoding', 'parallel_case' and 'name'
+    # Skipped if 'path' holds a module generated from the same description, unless 'force' is set
+    def build_verilog(self, path, force: bool=False, encoding: str='enum', encoding_table: Dict[str, int]=None, parallel_case: bool=True,
+                      name: str=None) -> None:
+        if path == '-':
+            self.write_verilog(sys.stdout, encoding, encoding_table, parallel_case, name)
+            return
+        digest = get_fsm_digest(self, 'verilog', encoding=encoding, encoding_table=encoding_table, parallel_case=parallel_case)
+        if not force and is_up_to_date(path, 'verilog', digest):
+            if self.stats is not None:
+                self.stats.count('verilog_builds_skipped')
+            return
+        with stage(self.stats, 'write_verilog'), open(path + '/ctrl.sv', 'w') as f:
+            self.write_verilog(f, encoding, encoding_table, parallel_case, name)
+        record_outputs(path, 'verilog', digest, ['ctrl.sv'])
+
+    # Writes a self-checking testbench ctrl_tb.sv and its vector files to folder 'path': 'n_cycles' random input vectors drawn
+    # from 'seed' (or the chunks of input vectors 'stimulus', one column per input) and the expected state and outputs
+    # 'fmt' selects $readmemh ('hex') or $readmemb ('bin') vector files, 'encoding' must match the one of build_verilog
+    def build_testbench(self, path, n_cycles: int=1000, seed: int=0, fmt: str='hex', stimulus=None, force: bool=False,
+                        encoding: str='enum', encoding_table: Dict[str, int]=None) -> None:
+        if fmt not in ('hex', 'bin'):
+            print('testbench vector format %s not supported yet' % fmt)
+            exit(2)
+        if n_cycles < 1:
+            raise ValueError('testbench needs at least one cycle')
+        width, codes = self.get_state_encoding(encoding, encoding_table)
+        if codes is None: # enum: int base type, declaration order from 0
+            width, codes = 32, dict([(s.name, i) for i, s in enumerate([self.default_state] + self.states)])
+        if width > 63:
+            raise ValueError('testbench vectors support state registers up to 63 bits')
+        files = ['ctrl_tb.sv', 'tb_stim.' + fmt, 'tb_expect.' + fmt]
+        digest = '' # Explicit stimulus is not hashed, never up to date
+        if stimulus is None:
+            digest = get_fsm_digest(self, 'testbench', n_cycles=n_cycles, seed=seed, fmt=fmt, encoding=encoding, encoding_table=encoding_table)
+            if not force and is_up_to_date(path, 'testbench', digest):
+                if self.stats is not None:
+                    self.stats.count('testbench_builds_skipped')
+                return
+            stimulus = get_random_stimulus(self.inputs, n_cycles, seed)
+        with stage(self.stats, 'simulate_vectors'):
+            write_vectors(self.get_simulator(), stimulus, n_cycles, path + '/' + files[1], path + '/' + files[2], width, codes, fmt)
+        with stage(self.stats, 'write_testbench'), open(path + '/' + files[0], 'w') as f:
+            write_testbench(f, self.clock, self.reset, self.inputs, self.outputs, n_cycles, width, files[1], files[2], fmt)
+        if self.stats is not None:
+            self.stats.count('testbench_cycles', n_cycles)
+        record_outputs(path, 'testbench', digest, files)
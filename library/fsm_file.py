@@ -0,0 +1,113 @@
+##################################################################
+#############         fsm_file.py                 ################
+# 1. Declarative FSM description files, plain text (.fsm) or #####
+#    JSON Lines (.jsonl), one arch or setting per line ###########
+# 2. Streaming loader, identical condition and output strings ####
+#    are parsed once, errors carry the file name and line ########
+##################################################################
+
+# imports:
+import json
+import re
+from typing import Dict, Iterator, List, TextIO, Tuple
+from library.base_classes import arch
+from library.cond_parser import parse
+from library.fsm_class import fsm
+
+FSM_FILE_EXTS = ('.fsm', '.jsonl')
+SETTINGS      = ('default_state', 'clock', 'reset') # fsm constructor arguments a file may set
+
+_ARCH_RE = re.compile(r'^\s*(?P<source>\S+)\s*->\s*(?P<dest>\S+)\s*:(?P<cond>[^:]*):(?P<out>[^:]*)$')
+_NAME_RE = re.compile(r'^[A-Za-z_]\w*$')
+
+# Yields (line number, record) for each line of a plain text description
+# record is ('arch', (source, dest, cond, out)), (setting, name) or ('error', message)
+# Lines are 'source -> dest : cond : out' or 'setting name', '#' starts a comment
+def _iter_text(f: TextIO) -> Iterator[Tuple[int, tuple]]:
+    for lineno, line in enumerate(f, 1):
+        line = line.split('#', 1)[0]
+        if not line.strip():
+            continue
+        m = _ARCH_RE.match(line)
+        if m:
+            yield lineno, ('arch', (m.group('source'), m.group('dest'), m.group('cond'), m.group('out')))
+            continue
+        words = line.split()
+        if len(words) != 2 or words[0] not in SETTINGS:
+            yield lineno, ('error', 'expected \'source -> dest : cond : out\' or one of %s followed by a name' % ', '.join(SETTINGS))
+        else:
+            yield lineno, (words[0], words[1])
+
+# Yields (line number, record) for each line of a JSON Lines description, see _iter_text
+# Lines are {"source": .., "dest": .., "cond": .., "out": ..} or objects of settings, e.g. {"default_state": "IDLE", "clock": "clk"}
+def _iter_jsonl(f: TextIO) -> Iterator[Tuple[int, tuple]]:
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield lineno, ('error', 'invalid JSON: ' + str(e))
+            continue
+        if not isinstance(obj, dict):
+            yield lineno, ('error', 'expected a JSON object')
+        elif 'source' in obj:
+            missing = [k for k in ('dest', 'cond', 'out') if k not in obj]
+            if missing:
+                yield lineno, ('error', 'arch is missing ' + ', '.join(missing))
+            else:
+                yield lineno, ('arch', (obj['source'], obj['dest'], obj['cond'], obj['out']))
+        else:
+            for key, value in obj.items():
+                if key not in SETTINGS:
+                    yield lineno, ('error', 'unknown setting %r, expected one of %s or an arch' % (key, ', '.join(SETTINGS)))
+                else:
+                    yield lineno, (key, value)
+
+# Returns (arch list, settings) of the description in text stream 'f', 'fmt' is 'fsm' or 'jsonl', 'name' is used in error messages
+# Each distinct condition or output string is parsed once, archs with equal strings share the parse tree
+def read_fsm_stream(f: TextIO, fmt: str='fsm', name: str='<stream>') -> Tuple[List[arch], Dict[str, str]]:
+    records = _iter_text(f) if fmt == 'fsm' else _iter_jsonl(f)
+    trees = {} # normalized string -> parse tree
+    arch_list = []
+    settings = {}
+    lineno = 0
+    try:
+        for lineno, (kind, value) in records:
+            if kind == 'error':
+                raise ValueError(value)
+            if kind != 'arch':
+                if not isinstance(value, str) or not _NAME_RE.match(value):
+                    raise ValueError('%s must be an identifier, found %r' % (kind, value))
+                settings[kind] = value
+                continue
+            (source, dest, cond_str, out_str) = value
+            for s in (source, dest):
+                if not isinstance(s, str) or not _NAME_RE.match(s):
+                    raise ValueError('state name must be an identifier, found %r' % (s,))
+            parsed = []
+            for s in (cond_str, out_str):
+                if not isinstance(s, str):
+                    raise ValueError('condition and output must be strings, found %r' % (s,))
+                norm = ' '.join(s.split())
+                if norm not in trees:
+                    trees[norm] = parse(norm)
+                parsed.append(trees[norm])
+            arch_list.append(arch(source, dest, parsed[0], parsed[1]))
+    except ValueError as e: # Add the location, parser messages only hold the position within the string
+        raise ValueError('%s:%d: %s' % (name, lineno, e)) from None
+    if not arch_list:
+        raise ValueError('%s: no archs found' % name)
+    return arch_list, settings
+
+# Returns (arch list, settings) of description file 'path', the format follows the file extension
+def read_fsm_file(path: str) -> Tuple[List[arch], Dict[str, str]]:
+    with open(path) as f:
+        return read_fsm_stream(f, 'jsonl' if path.endswith('.jsonl') else 'fsm', path)
+
+# Returns the fsm described by file 'path', keyword arguments are passed on to the fsm constructor
+def load_fsm_file(path: str, **kwargs) -> fsm:
+    arch_list, settings = read_fsm_file(path)
+    settings.update(kwargs)
+    return fsm(arch_list, **settings)
+
@@ -5,141 +5,119 @@
 ##################################################################
 
 # imports:
-from typing import List, Tuple
-from math import log2, ceil
-from boolean_parser.actions.boolean import BoolNot, BoolAnd, BoolOr
-from boolean_parser.actions.clause import Condition
-from rocon.base_classes import input, output, state, arch
+from typing import Dict, Iterator, List, Tuple
+from library.cond_parser import Condition, BoolNot, BoolAnd, BoolOr
+from library.base_classes import input, output, state, arch, sig_table
 
-# Find the maximum value 'max' of a signaled named 'name' in condition 'cond'
-def _get_max_val(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], name: str, max: int) -> int:
+# Yields the Condition leaves of 'cond' from left to right
+def _get_leaves(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr]) -> Iterator[type[Condition]]:
     if (isinstance(cond, Condition)): # Stopping condition
-        if cond.value.isdigit(): 
-            if (int(cond.value) > max) and (cond.name == name):
-                return int(cond.value)
-            else: 
-                return max
-        else: # Condition value is a different signal
-            return max # Do not adjust max
-    elif isinstance(cond, BoolNot): # Parse BoolNot
-        return _get_max_val(cond.conditions[0], name, max)
-    else: # Parse BoolAnd or BoolOr
-        lhs_max = _get_max_val(cond.conditions[0], name, max)
-        rhs_max = _get_max_val(cond.conditions[1], name, max)
-        if lhs_max > rhs_max:
-            return lhs_max 
-        else:
-            return rhs_max
+        yield cond
+    else: # Parse BoolNot, BoolAnd or BoolOr
+        for c in cond.conditions:
+            yield from _get_leaves(c)
 
-def _get_rhs_names(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], rhs_names: List[str]=[]) -> List[str]:
-    if (isinstance(cond, Condition)): # Stopping condition
-        if not cond.value.isdigit():
-            rhs_names.append(cond.value)
-        return rhs_names
-    elif isinstance(cond, BoolNot): # Parse BoolNot
-        return _get_rhs_names(cond.conditions[0], rhs_names)
-    else: # Parse BoolAnd or BoolOr
-        lhs_list = _get_rhs_names(cond.conditions[0], rhs_names)
-        rhs_list = _get_rhs_names(cond.conditions[1], rhs_names)
-        joined_list= lhs_list + rhs_list
-        return joined_list
+# Union-find over signal keys, returns the root of 'key' and compresses the path to it
+def _find(parent: Dict[tuple, tuple], key: tuple) -> tuple:
+    root = key
+    while parent[root] != root:
+        root = parent[root]
+    while parent[key] != root:
+        parent[key], key = root, parent[key]
+    return root
 
-def _find_missing_width(lhs_name: str, cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr]) -> str:
-    if (isinstance(cond, Condition)): # Stopping condition
-        if cond.name == lhs_name:
-            return cond.value
-        else:
-            return ''
-    elif isinstance(cond, BoolNot): # Parse BoolNot
-        return _find_missing_width(lhs_name, cond.conditions[0])
-    else: # Parse BoolAnd or BoolOr
-        lhs_rhs = _find_missing_width(lhs_name, cond.conditions[0])
-        rhs_rhs = _find_missing_width(lhs_name, cond.conditions[1])
-        if lhs_rhs == '': # Currently supporting only a single appearance in cond
-            return rhs_rhs 
-        else:
-            return lhs_rhs
+# Per-signal summary of an arch list, gathered in a single pass over all conditions and outputs
+# Signals are keyed ('i', name) for inputs and ('o', name) for outputs, in order of first appearance
+# Archs appended later extend the summary as if they were part of 'arch_list', union-find can not undo a removal
+class _sig_summary:
+    def __init__(self, arch_list: List[type[arch]]) -> None:
+        self.max_val = {} # key -> maximum literal the signal is compared to or assigned
+        self.parent  = {} # key -> union-find parent, signals compared to or assigned each other share a root
+        for a in arch_list:
+            self.add_arch(a)
 
-# Parse through arch_list returning a list of conditions and a list of unique signal names (inputs or outputs based on get_out switch):
-def _get_names_conds(arch_list: List[type[arch]], get_out: bool=False) -> Tuple[List[type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr]], List[str]]:
-    names_list, cond_list = [], [] 
-    for a in range(len(arch_list)):
-        if get_out: # Find outputs in arch.out:
-            if (isinstance(arch_list[a].out, Condition)):
-                names_list.append(arch_list[a].out.name)
-            else:
-                names_list.extend(arch_list[a].out.params)
-            cond_list.append(arch_list[a].out)
-        else: # Find inputs in arch.cond:
-            if (isinstance(arch_list[a].cond, Condition)):
-                names_list.append(arch_list[a].cond.name)
-            else:
-                names_list.extend(arch_list[a].cond.params)
-            cond_list.append(arch_list[a].cond)
-        if not get_out:
-            rhs_out_names = _get_rhs_names(arch_list[a].out)
-            rhs_cond_names = _get_rhs_names(arch_list[a].cond)
-            names_list += rhs_out_names + rhs_cond_names
-    names_list = list(set(names_list)) # Unique names of all signals (outputs or inputs)
-    return names_list, cond_list
+    def add_arch(self, a: type[arch]) -> None:
+        for leaf in _get_leaves(a.cond): # Inputs on both sides of arch.cond
+            self._add_leaf(('i', leaf.name), leaf.value)
+        for leaf in _get_leaves(a.out): # Outputs on the left, inputs on the right of arch.out
+            self._add_leaf(('o', leaf.name), leaf.value)
 
-def _get_widths(cond_list: List[type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr]], names_list: List[str]) -> List[int]:
-    max_val_list, width_list, width_missing = [], [], []
-    for i in range(len(names_list)):
-        max_val_list.append(0)
-    for i in range(len(names_list)): # Find maximum value for each signal for each condition:
-        for j in range(len(cond_list)): 
-            max_val_list[i] = _get_max_val(cond_list[j], names_list[i], max_val_list[i])
-    for w in range(len(max_val_list)): # Assign width to each input based on maximum value:
-        if (max_val_list[w]==0): # Signal not found in conditions or comapred to 0        
-            curr_width = 1
-            width_missing.append(w) 
-        else: 
-            curr_width = ceil(log2(max_val_list[w] + 1))
-        width_list.append(curr_width)
-    for w in width_missing: # Try to find missing widths:
-        new_width = 1
-        for cond in cond_list:
-            rhs = _find_missing_width(names_list[w], cond) # Find name of signal on the right hand side of the signal with the missing width
-            for name_ind, name in enumerate(names_list): # Go over all names and see if the rhs was assigned a different width
-                if rhs==name and width_list[name_ind]>new_width: 
-                    new_width = width_list[name_ind]>new_width
-        width_list[w] = new_width
-    return width_list
+    def _add_key(self, key: tuple) -> None:
+        if key not in self.parent:
+            self.parent[key] = key
+            self.max_val[key] = 0
 
-# Declare input or output base classes
-def _get_inout_list(names_list, width_list, get_out: bool=False) -> List[input] | List[output]:
-    inout_list = []
-    for i in range(len(names_list)): # Define inputs or outputs class instances for each signal
-        if get_out:
-            inout_list.append(output(names_list[i], width_list[i], 0)) 
+    def _add_leaf(self, lhs: tuple, value: str) -> None:
+        self._add_key(lhs)
+        if value.isdigit():
+            if int(value) > self.max_val[lhs]:
+                self.max_val[lhs] = int(value)
+        else: # RHS peer is an input signal
+            rhs = ('i', value)
+            self._add_key(rhs)
+            self.parent[_find(self.parent, lhs)] = _find(self.parent, rhs)
+
+    # Returns a dict key -> width, signals without a non-zero literal take the widest width among their RHS peers
+    def get_widths(self) -> Dict[tuple, int]:
+        group_width = {} # union-find root -> widest literal width in the group
+        for key, max_val in self.max_val.items():
+            root = _find(self.parent, key)
+            group_width[root] = max(group_width.get(root, 1), max_val.bit_length())
+        widths = {}
+        for key, max_val in self.max_val.items():
+            if max_val > 0:
+                widths[key] = max_val.bit_length()
+            else: # Signal not found in conditions or comapred to 0
+                widths[key] = group_width[_find(self.parent, key)]
+        return widths
+
+# Returns a tuple (inputs, outputs) of signal tables inferred from arch list
+def get_fsm_interfaces(arch_list: List[type[arch]]) -> Tuple[sig_table, sig_table]:
+    return get_summary_interfaces(_sig_summary(arch_list))
+
+# Returns a tuple (inputs, outputs) of signal tables of a signal summary
+def get_summary_interfaces(summary: type[_sig_summary]) -> Tuple[sig_table, sig_table]:
+    widths = summary.get_widths()
+    inputs, outputs = sig_table(), sig_table()
+    for (kind, name), width in widths.items(): # Define inputs or outputs class instances for each signal
+        if kind == 'o':
+            outputs.append(output(name, width, 0))
         else:
-            inout_list.append(input(names_list[i], width_list[i]))
-    return inout_list
+            inputs.append(input(name, width))
+    return inputs, outputs
+
+# Returns a signal table of inputs or outputs depending on 'get_out' value from arch list
+def get_fsm_interface(arch_list: List[type[arch]], get_out: bool=False) -> sig_table:
+    inputs, outputs = get_fsm_interfaces(arch_list)
+    return outputs if get_out else inputs
 
-# Returns a list of inputs or outputs depending on 'get_out' value from arch list
-def get_fsm_interface(arch_list: List[type[arch]], get_out: bool=False) -> List[input] | List[output]:
-    names_list, cond_list = _get_names_conds(arch_list, get_out) # Get names and conditions
-    width_list = _get_widths(cond_list, names_list) # Get signal widths 
-    return _get_inout_list(names_list, width_list, get_out) # Declare base classes
+# Returns a dict mapping each source state name to its archs, in arch_list order
+def get_state_archs(arch_list: List[type[arch]]) -> Dict[str, List[type[arch]]]:
+    state_archs = {}
+    for a in arch_list:
+        state_archs.setdefault(a.source.name, []).append(a)
+    return state_archs
 
 # Returns a tuple (default_state, list_of_states) for a given arch_list
+# States are interned: archs sharing a state name are rebound to the same state instance
 def get_fsm_states(arch_list: List[arch], ds_name=None) -> Tuple[state, List[state]]:
     states = []
-    state_names = []    
+    state_dict = {} # state name -> state instance
     final_state_list = []
-    for i in range(len(arch_list)):
-        if arch_list[i].source.name not in state_names: # Found new state in arch.source
-            states.append(arch_list[i].source)
-            state_names.append(arch_list[i].source.name)
-        if arch_list[i].dest.name not in state_names: # Found new state in arch.dest
-            states.append(arch_list[i].dest)
-            state_names.append(arch_list[i].dest.name)
+    for a in arch_list:
+        if a.source.name not in state_dict: # Found new state in arch.source
+            states.append(a.source)
+            state_dict[a.source.name] = a.source
+        a.source = state_dict[a.source.name]
+        if a.dest.name not in state_dict: # Found new state in arch.dest
+            states.append(a.dest)
+            state_dict[a.dest.name] = a.dest
+        a.dest = state_dict[a.dest.name]
     if ds_name is None: # If default_state name is not specified, use first state
         states[0].reset=True
     else: # default state specified
-        if ds_name in state_names: # this is the default state specified
-            states[state_names.index(ds_name)].reset=True
+        if ds_name in state_dict: # this is the default state specified
+            state_dict[ds_name].reset=True
         else:
             states.append(state(ds_name, True))
     reset_exists = False
@@ -0,0 +1,148 @@
+##################################################################
+#############         logic_min.py                ################
+# 1. Quine-McCluskey two-level minimization of a condition over ##
+#    the bits of the signals it references #######################
+# 2. Minimized sum-of-products trees per united condition class ##
+#    for the verilog and graph backends ##########################
+##################################################################
+
+# imports:
+from typing import Dict, List, Set, Tuple
+import numpy as np
+from library.cond_parser import Condition, BitSelect, BoolNot, BoolAnd, BoolOr
+from library.base_classes import input, arch
+from library.cond_compiler import get_sig_cols, compile_cond
+from library.cond_compare import _get_support, _get_permuatations_dig
+
+_MAX_BITS = 10 # Conditions over more input bits keep their written form
+
+# Returns the number of nodes of a condition tree
+def _get_size(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr]) -> int:
+    if isinstance(cond, Condition):
+        return 1
+    return 1 + sum([_get_size(c) for c in cond.conditions])
+
+# Returns the prime implicants, (value, mask) cubes where mask bits are don't care, of the function true on 'minterms'
+def _get_primes(minterms: Set[int], n_bits: int) -> Set[Tuple[int, int]]:
+    primes = set()
+    current = {} # mask -> values of the cubes with that mask
+    for m in minterms:
+        current.setdefault(0, set()).add(m)
+    while current:
+        merged = {}
+        used = set()
+        for mask, values in current.items():
+            for v in values:
+                for b in range(n_bits):
+                    bit = 1 << b
+                    if mask & bit or v & bit or (v | bit) not in values:
+                        continue
+                    merged.setdefault(mask | bit, set()).add(v) # v has the bit cleared, so it names the merged cube
+                    used.add((v, mask))
+                    used.add((v | bit, mask))
+        for mask, values in current.items():
+            for v in values:
+                if (v, mask) not in used:
+                    primes.add((v, mask))
+        current = merged
+    return primes
+
+# Returns the minterms covered by cube (value, mask)
+def _get_cube_minterms(value: int, mask: int) -> List[int]:
+    minterms = [value]
+    bit = 1
+    while bit <= mask:
+        if mask & bit:
+            minterms += [m | bit for m in minterms]
+        bit <<= 1
+    return minterms
+
+# Returns a minimal cover of 'minterms' by 'primes': essential primes first, then greedily the prime covering most, fewest literals on ties
+def _get_cover(minterms: Set[int], primes: Set[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    covers = {} # prime -> covered minterms
+    by_minterm = {} # minterm -> primes covering it
+    for p in sorted(primes):
+        covers[p] = set(_get_cube_minterms(*p))
+        for m in covers[p]:
+            by_minterm.setdefault(m, []).append(p)
+    cover = []
+    left = set(minterms)
+    for m in sorted(minterms):
+        if len(by_minterm[m]) == 1 and by_minterm[m][0] not in cover: # Essential prime
+            cover.append(by_minterm[m][0])
+            left -= covers[by_minterm[m][0]]
+    while left:
+        best = max(covers, key=lambda p: (len(covers[p] & left), bin(p[1]).count('1')))
+        cover.append(best)
+        left -= covers[best]
+    return cover
+
+# Returns a left associative binary tree of 'nodes' joined by 'op' (BoolAnd or BoolOr)
+def _join(nodes: List, op: type) -> object:
+    tree = nodes[0]
+    for n in nodes[1:]:
+        tree = op([tree, n])
+    return tree
+
+# Returns the tree of cube (value, mask) over 'sigs', whose bits are laid out MSB first, last signal in the lowest bits
+# A fully specified signal is compared as a whole, otherwise each specified bit is compared on its own (BitSelect)
+def _cube_2_tree(value: int, mask: int, sigs: List[type[input]]) -> object:
+    literals = []
+    shift = sum([s.width for s in sigs])
+    for s in sigs:
+        shift -= s.width
+        full = (1 << s.width) - 1
+        sig_mask = (mask >> shift) & full
+        sig_value = (value >> shift) & full
+        if sig_mask == 0:
+            literals.append(Condition(s.name, '=', str(sig_value)))
+        else:
+            for b in range(s.width - 1, -1, -1):
+                if not sig_mask & (1 << b):
+                    literals.append(BitSelect(s.name, b, '=', str((sig_value >> b) & 1)))
+    return _join(literals, BoolAnd)
+
+# Returns the minimal sum-of-products tree of 'cond', or 'cond' itself if that is not smaller, or 'cond' references more than 'max_bits' input bits
+# 'fn' evaluates 'cond' on input matrices with a column per signal of 'inputs' (e.g. arch.cond_fn), compiled here if None
+def minimize_cond(cond: type[Condition]|type[BoolAnd]|type[BoolNot]|type[BoolOr], inputs: List[type[input]], max_bits: int=_MAX_BITS,
+                  fn=None) -> object:
+    support = _get_support(cond)
+    sigs = [s for s in inputs if s.name in support]
+    n_bits = sum([s.width for s in sigs])
+    if n_bits == 0 or n_bits > max_bits:
+        return cond
+    values = next(_get_permuatations_dig(sigs, 1 << n_bits)) # Row i is input vector i, same bit layout as the cubes
+    if fn is None:
+        fn, cols = compile_cond(cond, get_sig_cols(sigs), batched=True), get_sig_cols(sigs)
+    else:
+        cols = get_sig_cols(inputs)
+    vectors = np.zeros((len(values), len(cols)), dtype=np.int64) # Signals outside the support do not matter
+    vectors[:, [cols[s.name] for s in sigs]] = values
+    minterms = set(np.nonzero(fn(vectors))[0].tolist())
+    if not minterms or len(minterms) == 1 << n_bits: # Constant, no comparison to print
+        return cond
+    cover = _get_cover(minterms, _get_primes(minterms, n_bits))
+    tree = _join([_cube_2_tree(v, m, sigs) for (v, m) in sorted(cover)], BoolOr)
+    return tree if _get_size(tree) < _get_size(cond) else cond
+
+# Returns condition class (arch.index) -> minimized condition tree, for every class of 'arch_list'
+# 'memo' (condition text and its signals -> minimized tree) keeps results of previous calls with the same 'max_bits'
+# Conditions are evaluated through arch.cond_fn, archs must be bound to 'inputs' or to no interface
+def minimize_conds(arch_list: List[type[arch]], inputs: List[type[input]], max_bits: int=_MAX_BITS, memo: Dict[tuple, object]=None) -> Dict[int, object]:
+    min_conds = {}
+    used = set()
+    for a in arch_list:
+        if a.index not in min_conds: # Equivalent conditions share one minimized form
+            if memo is None:
+                min_conds[a.index] = minimize_cond(a.cond, inputs, max_bits, a.cond_fn)
+                continue
+            support = _get_support(a.cond)
+            key = (repr(a.cond), tuple([(s.name, s.width) for s in inputs if s.name in support])) # Bit layout follows the inputs order
+            if key not in memo:
+                memo[key] = minimize_cond(a.cond, inputs, max_bits, a.cond_fn)
+            min_conds[a.index] = memo[key]
+            used.add(key)
+    if memo is not None:
+        for key in set(memo) - used: # Drop conditions no longer in 'arch_list'
+            del memo[key]
+    return min_conds
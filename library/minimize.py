@@ -0,0 +1,148 @@
+##################################################################
+#############         minimize.py                 ################
+# 1. Equivalent states by Hopcroft partition refinement over #####
+#    the united condition indices and outputs of their archs #####
+# 2. Merge every class of equivalent states into one state #######
+##################################################################
+
+# imports:
+from typing import Dict, List, Tuple
+from library.cond_parser import Condition, BoolAnd
+from library.base_classes import state, arch
+from library.inferring import get_state_archs
+
+# Returns output name -> assigned value (number or input name) of 'out', later assignments win
+def _get_assigns(out: type[Condition]|type[BoolAnd], assigns: Dict[str, str]=None) -> Dict[str, str]:
+    if assigns is None:
+        assigns = {}
+    if isinstance(out, Condition):
+        assigns[out.name] = out.value
+    else:
+        for c in out.conditions:
+            _get_assigns(c, assigns)
+    return assigns
+
+# Returns the outputs driven by output logic when 'archs' are the archs whose dest equals next_state, in priority order
+def _get_driven(archs: List[type[arch]]) -> Dict[str, str]:
+    assigns = {}
+    for a in archs:
+        _get_assigns(a.out, assigns)
+    return assigns
+
+# Returns the initial block key of state 's': for every arch in priority order its condition index, outputs and self-loop flag
+# Output logic compares next_state with each arch dest, so a self-loop also drives its outputs when no condition is met
+def _get_shape(s: type[state], archs: List[type[arch]]) -> tuple:
+    return tuple([(a.index, repr(a.out), a.dest is s) for a in archs])
+
+# Hopcroft refinement of 'blocks' (lists of state names), transition label k is the k-th arch of a state
+# Returns the coarsest refinement in which states of a block reach the same blocks under every label
+def _refine(blocks: List[List[str]], delta: Dict[str, List[str]]) -> List[List[str]]:
+    inverse = {} # (label, dest) -> source names
+    labels = set()
+    for src, dests in delta.items():
+        for k, dest in enumerate(dests):
+            if dest is not None: # Self-loops are part of the shape
+                inverse.setdefault((k, dest), []).append(src)
+                labels.add(k)
+    block_of = {} # state name -> block id
+    members = {} # block id -> set of state names
+    for i, b in enumerate(blocks):
+        members[i] = set(b)
+        for name in b:
+            block_of[name] = i
+    work = set([(i, k) for i in members for k in labels])
+    next_id = len(blocks)
+    while work:
+        (splitter, k) = work.pop()
+        preds = set()
+        for dest in members[splitter]:
+            preds.update(inverse.get((k, dest), []))
+        touched = {} # block id -> its states in preds
+        for name in preds:
+            touched.setdefault(block_of[name], set()).add(name)
+        for b, inside in touched.items():
+            if len(inside) == len(members[b]):
+                continue
+            members[b] -= inside # Split block b, 'inside' gets a new id
+            members[next_id] = inside
+            for name in inside:
+                block_of[name] = next_id
+            for l in labels:
+                if (b, l) in work:
+                    work.add((next_id, l))
+                else: # Processing the smaller half is enough
+                    work.add((next_id, l) if len(inside) <= len(members[b]) else (b, l))
+            next_id += 1
+    order = {} # keep the first appearance order of the input blocks
+    for b in blocks:
+        for name in b:
+            order.setdefault(block_of[name], [])
+    for b in blocks:
+        for name in b:
+            order[block_of[name]].append(name)
+    return list(order.values())
+
+# Returns blocks (lists of state names, in 'states' order) of equivalent states
+def get_equivalent_states(states: List[type[state]], arch_list: List[type[arch]]) -> List[List[str]]:
+    state_archs = get_state_archs(arch_list)
+    shapes = {}
+    delta = {} # state name -> dest name of each arch, None for self-loops
+    for s in states:
+        archs = state_archs.get(s.name, [])
+        shapes.setdefault(_get_shape(s, archs), []).append(s.name)
+        delta[s.name] = [None if a.dest is s else a.dest.name for a in archs]
+    blocks = list(shapes.values())
+    while True:
+        blocks = _refine(blocks, delta)
+        block_of = {}
+        for i, b in enumerate(blocks):
+            for name in b:
+                block_of[name] = i
+        # Output logic drives the outputs of every arch whose dest equals next_state. Once a block is merged, that is every
+        # arch into the block, so for each state, each possible next state in a block must drive the same outputs as the whole block.
+        # The state itself is a possible next state (no condition met), non self-loops into its own block would turn into self-loops
+        split = set()
+        for name in block_of:
+            into = {} # block id -> archs of this state into it
+            for a, d in zip(state_archs.get(name, []), delta[name]):
+                into.setdefault(block_of[name if d is None else d], []).append(a)
+            for b, archs in into.items():
+                nexts = list(dict.fromkeys([a.dest.name for a in archs] + ([name] if b == block_of[name] else [])))
+                driven = _get_driven(archs)
+                if all([_get_driven([a for a in archs if a.dest.name == n]) == driven for n in nexts]):
+                    continue
+                if b == block_of[name] and len(blocks[b]) > 1: # Keep this state apart from its own archs' dests
+                    split.add(name)
+                else: # Keep the next states apart
+                    split.update(nexts[1:])
+        if not split:
+            return blocks
+        new_blocks = []
+        for b in blocks:
+            rest = [name for name in b if name not in split]
+            if rest:
+                new_blocks.append(rest)
+            new_blocks += [[name] for name in b if name in split] # Always a strictly finer partition, so this terminates
+        blocks = new_blocks
+
+# Merge equivalent states, the default state or else the first state of a block is kept
+# Returns (kept states without the default state, arch list of the kept states, kept name -> merged names)
+def merge_states(default_state: type[state], states: List[type[state]], arch_list: List[type[arch]]) -> Tuple[List[state], List[arch], Dict[str, List[str]]]:
+    all_states = [default_state] + states
+    by_name = {}
+    for s in all_states:
+        by_name[s.name] = s
+    keep = {} # state name -> kept state
+    merged = {}
+    for b in get_equivalent_states(all_states, arch_list):
+        rep = by_name[b[0]] # default_state is first in all_states, so first of its block
+        for name in b:
+            keep[name] = rep
+        if len(b) > 1:
+            merged[rep.name] = b[1:]
+    new_archs = []
+    for a in arch_list:
+        if keep[a.source.name] is a.source: # Archs of merged states duplicate those of the kept state
+            a.dest = keep[a.dest.name]
+            new_archs.append(a)
+    return [s for s in states if keep[s.name] is s], new_archs, merged
@@ -0,0 +1,79 @@
+##################################################################
+#############         profiling.py                ################
+# 1. Per-stage wall time, call and work counters of an fsm #######
+# 2. Process-wide default used by fsms built without explicit ####
+#    profiling arguments (main.py --profile) #####################
+##################################################################
+
+# imports:
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict
+
+_NULL_STAGE = nullcontext() # Shared by all disabled stages, entering it costs next to nothing
+
+# Stats class, one per fsm, filled by its stages:
+class fsm_stats:
+    def __init__(self, hook: Callable=None) -> None:
+        self.stages   = {} # stage name -> {'seconds': total wall time, 'calls': number of runs}
+        self.counters = {} # counter name -> int, work done (input vectors enumerated, equivalence checks...)
+        self.hook     = hook # called as hook(stage name, seconds, stats) after every stage run
+
+    # Context manager timing a single run of stage 'name'
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += elapsed
+            entry['calls'] += 1
+            if self.hook is not None:
+                self.hook(name, elapsed, self)
+
+    def count(self, name: str, n: int=1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # Returns a JSON serializable copy
+    def as_dict(self) -> Dict[str, dict]:
+        return {'stages': {k: dict(v) for k, v in self.stages.items()}, 'counters': dict(self.counters)}
+
+    # Inverse of as_dict, e.g. for stats returned by a worker process
+    @classmethod
+    def from_dict(cls, d: Dict[str, dict]) -> 'fsm_stats':
+        stats = cls()
+        stats.stages = {k: dict(v) for k, v in d['stages'].items()}
+        stats.counters = dict(d['counters'])
+        return stats
+
+    # Returns a human readable table, stages in first run order
+    def summary(self) -> str:
+        lines = ['%-20s %12s %8s' % ('stage', 'time [ms]', 'calls')]
+        for name, entry in self.stages.items():
+            lines.append('%-20s %12.3f %8d' % (name, entry['seconds'] * 1000, entry['calls']))
+        for name, value in self.counters.items():
+            lines.append('%-20s %21d' % (name, value))
+        return '\n'.join(lines)
+
+# Returns a context manager timing stage 'name' into 'stats', a shared no-op one if profiling is disabled (stats is None)
+def stage(stats: fsm_stats, name: str):
+    if stats is None:
+        return _NULL_STAGE
+    return stats.stage(name)
+
+_default_profile = False
+_default_hook    = None
+
+# Enable or disable profiling of fsms built without explicit profiling arguments, 'hook' is passed to their stats
+def set_default_profile(enabled: bool, hook: Callable=None) -> None:
+    global _default_profile, _default_hook
+    _default_profile = enabled
+    _default_hook = hook
+
+def get_default_profile() -> bool:
+    return _default_profile
+
+def get_default_profile_hook() -> Callable:
+    return _default_hook
@@ -0,0 +1,53 @@
+##################################################################
+#############         rebuild_cache.py            ################
+# 1. Content hash of an fsm description and generator settings ###
+# 2. Output folder manifest, generation is skipped when the #####
+#    recorded hash matches and the outputs still exist ###########
+##################################################################
+
+# imports:
+import hashlib
+import json
+import os
+from typing import List
+
+GENERATOR_VERSION = '2' # Bump when generated output changes for the same description
+MANIFEST_NAME     = '.rocon_manifest.json'
+
+# Returns a hex digest of everything generated output of kind 'kind' depends on, extra settings are passed as 'params'
+def get_fsm_digest(machine, kind: str, **params) -> str:
+    h = hashlib.sha256()
+    for item in [GENERATOR_VERSION, kind, machine.clock.name, machine.reset.name, machine.default_state.name]:
+        h.update(repr(item).encode() + b'\0')
+    for a in machine.arch_list: # Parse trees print in a normalized form, independent of source string spacing
+        h.update(repr((a.source.name, a.dest.name, repr(a.cond), repr(a.out))).encode() + b'\0')
+    if machine.min_conds is not None: # Emitted condition forms
+        h.update(repr(sorted([(k, repr(c)) for k, c in machine.min_conds.items()])).encode() + b'\0')
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def _read_manifest(path: str) -> dict:
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError): # Missing or corrupted manifest, rebuild
+        return {}
+
+# Returns True if outputs of kind 'kind' in folder 'path' were generated from 'digest' and all still exist
+def is_up_to_date(path: str, kind: str, digest: str) -> bool:
+    entry = _read_manifest(path).get(kind)
+    if entry is None or entry.get('digest') != digest:
+        return False
+    for name in entry.get('files', []):
+        if not os.path.exists(os.path.join(path, name)):
+            return False
+    return True
+
+# Record that 'files' (relative to 'path') of kind 'kind' were generated from 'digest'
+def record_outputs(path: str, kind: str, digest: str, files: List[str]) -> None:
+    manifest = _read_manifest(path)
+    manifest[kind] = {'digest': digest, 'files': files}
+    tmp_name = os.path.join(path, MANIFEST_NAME + '.tmp')
+    with open(tmp_name, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_name, os.path.join(path, MANIFEST_NAME)) # Atomic, a concurrent reader never sees a partial file
@@ -0,0 +1,114 @@
+##################################################################
+#############         simulator.py                ################
+# 1. Compile an fsm into dense next-state and output tables ######
+#    indexed by (state, encoded input vector) ####################
+# 2. Cycle simulation of input traces, single, batched or ########
+#    streamed, returning state and output traces #################
+##################################################################
+
+# imports:
+from typing import Iterator, List, Tuple
+import numpy as np
+from library.cond_compare import _get_permuatations_dig
+from library.inferring import get_state_archs
+
+_MAX_INPUT_BITS = 20 # Tables hold 2^bits entries per state
+
+# FSM simulator class, built from an fsm instance:
+class fsm_simulator:
+    def __init__(self, machine, max_input_bits: int=_MAX_INPUT_BITS) -> None:
+        self.inputs  = machine.inputs
+        self.outputs = machine.outputs
+        self.states  = [machine.default_state] + machine.states # state index -> state, index 0 is the reset state
+        self.state_names = [s.name for s in self.states]
+        input_bits = sum([i.width for i in self.inputs])
+        if input_bits > max_input_bits:
+            raise ValueError('FSM has %d input bits, dense tables are limited to %d (max_input_bits)' % (input_bits, max_input_bits))
+        self.shifts = [] # bit offset of each input in an encoded input vector, last input in the lowest bits
+        shift = input_bits
+        for i in self.inputs:
+            shift -= i.width
+            self.shifts.append(shift)
+        self.n_codes = 1 << input_bits
+        self.next_state, self.out = self._build_tables(machine.arch_list)
+        self._next_flat = self.next_state.ravel().tolist() # Python list indexing is the fastest scalar lookup
+
+    # Returns next_state[state, code] and out[state, code, output] tables, same priority as the generated verilog
+    # Archs are evaluated through their compiled cond_fn / out_fn, bound to the interface of the fsm
+    def _build_tables(self, arch_list) -> Tuple[np.ndarray, np.ndarray]:
+        n_states = len(self.states)
+        state_index = {}
+        for i, name in enumerate(self.state_names):
+            state_index[name] = i
+        next_state = np.empty((n_states, self.n_codes), dtype=np.int32)
+        out = np.empty((n_states, self.n_codes, len(self.outputs)), dtype=np.int64)
+        out[:, :, :] = [o.default for o in self.outputs]
+        state_archs = get_state_archs(arch_list)
+        start = 0
+        for chunk in _get_permuatations_dig(self.inputs): # Rows come in encoded input vector order
+            stop = start + len(chunk)
+            for s, name in enumerate(self.state_names):
+                ns = np.full(len(chunk), s, dtype=np.int32) # No arch taken: stay
+                taken = np.zeros(len(chunk), dtype=bool)
+                archs = state_archs.get(name, [])
+                for a in archs: # if / else if chain: first met condition wins
+                    met = a.cond_fn(chunk) & ~taken
+                    ns[met] = state_index[a.dest.name]
+                    taken |= met
+                next_state[s, start:stop] = ns
+                for a in archs: # Outputs of every arch whose dest is the next state, later archs override
+                    hit = ns == state_index[a.dest.name]
+                    for o, value in enumerate(a.out_fn(chunk)):
+                        if value is not None: # Output assigned by this arch
+                            out[s, start:stop, o][hit] = value[hit] if isinstance(value, np.ndarray) else value
+            start = stop
+        return next_state, out
+
+    # Returns encoded input vectors of 'values', an array with one input vector (one column per input) per row
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.int64).reshape(-1, len(self.inputs))
+        codes = np.zeros(len(values), dtype=np.int64)
+        for i, sig in enumerate(self.inputs):
+            codes |= (values[:, i] & ((1 << sig.width) - 1)) << self.shifts[i]
+        return codes
+
+    # Simulate a single trace of encoded inputs 'codes' from state index 'state'
+    # Returns (states, outputs, final_state): states[t] and outputs[t] are the current state and outputs at cycle t
+    def run_codes(self, codes: np.ndarray, state: int=0) -> Tuple[np.ndarray, np.ndarray, int]:
+        next_flat, n_codes = self._next_flat, self.n_codes
+        codes = np.asarray(codes, dtype=np.int64)
+        states = np.empty(len(codes), dtype=np.int32)
+        trace = []
+        append = trace.append
+        for c in codes.tolist():
+            append(state)
+            state = next_flat[state * n_codes + c]
+        states[:] = trace
+        return states, self.out[states, codes], state
+
+    # Simulate a single trace of input vectors 'values' (one row per cycle), see run_codes
+    def run(self, values: np.ndarray, state: int=0) -> Tuple[np.ndarray, np.ndarray, int]:
+        return self.run_codes(self.encode(values), state)
+
+    # Simulate independent traces in lock-step, 'values' is (traces, cycles, inputs)
+    # Returns (states, outputs, final_states) with a leading traces axis
+    def run_batch(self, values: np.ndarray, states: np.ndarray=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        values = np.asarray(values, dtype=np.int64)
+        (n_traces, n_cycles) = values.shape[:2]
+        codes = self.encode(values.reshape(-1, len(self.inputs))).reshape(n_traces, n_cycles)
+        state = np.zeros(n_traces, dtype=np.int32) if states is None else np.asarray(states, dtype=np.int32)
+        state_trace = np.empty((n_traces, n_cycles), dtype=np.int32)
+        for t in range(n_cycles): # One vectorized table lookup per cycle for all traces
+            state_trace[:, t] = state
+            state = self.next_state[state, codes[:, t]]
+        return state_trace, self.out[state_trace, codes], state
+
+    # Simulate a trace streamed as chunks of input vectors, yields (states, outputs) per chunk
+    def run_stream(self, chunks: Iterator[np.ndarray], state: int=0) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        for chunk in chunks:
+            states, outputs, state = self.run(chunk, state)
+            yield states, outputs
+
+    # Returns the state names of a state index trace
+    def get_state_names(self, states: np.ndarray) -> List[str]:
+        return [self.state_names[s] for s in np.asarray(states).tolist()]
@@ -0,0 +1,43 @@
+##################################################################
+#############         state_encoding.py           ################
+# 1. State encoding tables: binary, gray, one-hot or user ########
+#    specified codes, state name -> code #########################
+##################################################################
+
+# imports:
+from typing import Dict, List, Tuple
+from library.base_classes import state
+
+ENCODINGS = ('enum', 'binary', 'gray', 'onehot', 'user') # 'enum' leaves the encoding to the synthesis tool
+
+# Returns (state register width, state name -> code) of 'states' (default state first) under 'encoding'
+# 'table' holds the codes of the 'user' encoding, returns (None, None) for 'enum'
+def get_state_encoding(states: List[type[state]], encoding: str='enum', table: Dict[str, int]=None) -> Tuple[int, Dict[str, int]]:
+    names = [s.name for s in states]
+    if encoding == 'enum':
+        return None, None
+    elif encoding == 'binary':
+        codes = [i for i in range(len(names))]
+    elif encoding == 'gray': # Consecutive states differ in a single bit
+        codes = [i ^ (i >> 1) for i in range(len(names))]
+    elif encoding == 'onehot':
+        codes = [1 << i for i in range(len(names))]
+    elif encoding == 'user':
+        if table is None:
+            raise ValueError('user state encoding needs a table of state name -> code')
+        missing = [n for n in names if n not in table]
+        if missing:
+            raise ValueError('user state encoding table has no code for state(s) ' + ', '.join(missing))
+        codes = [table[n] for n in names]
+        if any([not isinstance(c, int) or c < 0 for c in codes]):
+            raise ValueError('user state encoding codes must be non-negative integers')
+        if len(set(codes)) != len(codes):
+            raise ValueError('user state encoding table assigns the same code to more than one state')
+    else:
+        print('state encoding %s not supported yet' % encoding)
+        exit(2)
+    if encoding == 'onehot':
+        width = len(names)
+    else:
+        width = max(1, max(codes).bit_length())
+    return width, dict(zip(names, codes))
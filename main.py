@@ -1,34 +1,146 @@
 import argparse
+import json
+import os
 import sys
 from examples.examples import cntr_exmp, cmp_exmp
+from library.batch import run_batch
+from library.daemon import fsm_daemon
+from library.equiv_cache import get_default_cache_path, get_default_equiv_cache, remove_cache_file, set_default_equiv_cache
+from library.profiling import fsm_stats, set_default_profile
 
 def flag_parser():
     # Instantiate the parser:
     parser = argparse.ArgumentParser(description='RoControl - FSM graphs and verilog generation')
+    # FSM description sources:
+    parser.add_argument('sources', nargs='*', help='FSM sources, description files (.fsm / .jsonl) or module:function / file.py:function returning an fsm, each built into its own subfolder')
     # Path to output folder:
-    parser.add_argument('-o', '--out_folder', type=str, help='Path to desired output folder')
+    parser.add_argument('-o', '--out_folder', type=str, help='Path to desired output folder, \'-\' writes verilog to stdout')
     # Create graph flag:
     parser.add_argument('-g', '--graph', action='store_true', help='I want a nice graph')
+    # Graph rendering:
+    parser.add_argument('--graph-format', type=str, default='pdf', help='Graphviz output format, e.g. pdf, png, svg')
+    parser.add_argument('--dot-only', action='store_true', help='Only write the DOT file, do not run Graphviz')
+    parser.add_argument('--split-graph', action='store_true', help='Also write and render one graph file per state')
     # Create code flag:
     parser.add_argument('-v', '--verilog', action='store_true', help='I want a nice module')
+    # State encoding:
+    parser.add_argument('--encoding', type=str, default='enum', choices=['enum', 'binary', 'gray', 'onehot'], help='Verilog state encoding, enum leaves it to the synthesis tool')
+    parser.add_argument('--encoding-table', type=str, help='JSON file of state name -> code, user specified state encoding')
+    # Next state decode:
+    parser.add_argument('--no-parallel-case', action='store_true', help='Always emit priority if / else if chains, even for disjoint conditions')
+    # Self-checking testbench:
+    parser.add_argument('-t', '--testbench', type=int, metavar='CYCLES', help='Write a testbench with this many random stimulus cycles and expected vectors')
+    parser.add_argument('--tb-seed', type=int, default=0, help='Seed of the testbench stimulus')
+    parser.add_argument('--tb-format', type=str, default='hex', choices=['hex', 'bin'], help='Testbench vector files, $readmemh or $readmemb')
+    # Number of worker processes:
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of FSMs built in parallel')
+    # Rebuild even if outputs are up to date:
+    parser.add_argument('-f', '--force', action='store_true', help='Regenerate outputs even if the description did not change')
+    # Persistent condition equivalence cache, off unless enabled here or by environment variable ROCON_EQUIV_CACHE:
+    parser.add_argument('--equiv-cache', type=str, default=os.environ.get('ROCON_EQUIV_CACHE') or None, metavar='PATH',
+                        help='Keep condition fingerprints in cache file PATH between runs, e.g. ' + get_default_cache_path())
+    parser.add_argument('--no-equiv-cache', action='store_true', help='Do not read or write the condition equivalence cache, overrides ROCON_EQUIV_CACHE')
+    parser.add_argument('--clear-equiv-cache', action='store_true', help='Empty the condition equivalence cache file (the default one if not enabled) before building')
+    # State minimization:
+    parser.add_argument('-m', '--minimize', action='store_true', help='Merge equivalent states before generating outputs')
+    # Condition minimization:
+    parser.add_argument('--minimize-conds', action='store_true', help='Emit conditions as minimal sums of products over the input bits')
+    # Watch / daemon mode:
+    parser.add_argument('-w', '--watch', action='store_true', help='Keep the loaded FSMs in memory, rebuild sources when their file changes and serve commands (build, reload, add, remove, status, quit) from stdin, runs until quit')
+    parser.add_argument('--socket', type=str, help='With --watch, also serve commands on this unix socket path')
+    parser.add_argument('--no-stdin', action='store_true', help='With --watch, do not read commands from stdin')
+    parser.add_argument('--watch-interval', type=float, default=0.5, help='Seconds between source file checks in watch mode')
+    # Per-stage profiling:
+    parser.add_argument('--profile', action='store_true', help='Print per-stage time and work counters of every FSM to stderr')
+    parser.add_argument('--profile-json', type=str, help='Write per-stage profiles of every FSM to this JSON file')
     # Check if empty flags:
     if len(sys.argv)==1:
         parser.print_help(sys.stderr)
         sys.exit(1)
     # Parse:
     args = parser.parse_args()
-    return args.out_folder, args.graph, args.verilog
+    if args.out_folder is None and (args.sources or args.watch or args.graph or args.verilog or args.testbench is not None):
+        parser.error('-o/--out_folder is required to build FSM sources or outputs')
+    return args
+
+# Print and / or dump the per-FSM profiles in 'results' ((source, error, stats) tuples)
+def report_profiles(args, results) -> None:
+    profiles = {}
+    for source, error, stats in results:
+        if stats is None:
+            continue
+        profiles[source] = stats
+        if args.profile:
+            print('Profile of ' + source, file=sys.stderr)
+            print(fsm_stats.from_dict(stats).summary(), file=sys.stderr)
+    if args.profile_json:
+        with open(args.profile_json, 'w') as f:
+            json.dump(profiles, f, indent=2)
 
 def main():
-    out_folder, graph, verilog = flag_parser()
-    # Get FSM:
-    counter = cntr_exmp()
-    if (graph):
-        # Generate graph:
-        counter.build_graph(out_folder)
-    if (verilog):
-        # Generate verilog:
-        counter.build_verilog(out_folder)
+    args = flag_parser()
+    set_default_profile(args.profile or args.profile_json is not None)
+    cache_path = None if args.no_equiv_cache else args.equiv_cache
+    set_default_equiv_cache(cache_path)
+    if args.clear_equiv_cache:
+        if cache_path is not None:
+            get_default_equiv_cache().clear()
+        else: # Not enabled, only drop a default cache file left by earlier runs
+            remove_cache_file(get_default_cache_path())
+    graph_opts = {'fmt': None if args.dot_only else args.graph_format, 'split': args.split_graph}
+    verilog_opts = {'encoding': args.encoding, 'parallel_case': not args.no_parallel_case}
+    if args.encoding_table is not None:
+        with open(args.encoding_table) as f:
+            verilog_opts.update({'encoding': 'user', 'encoding_table': json.load(f)})
+    tb_opts = None if args.testbench is None else {'n_cycles': args.testbench, 'seed': args.tb_seed, 'fmt': args.tb_format}
+    if args.watch:
+        if args.out_folder == '-':
+            print('watch mode needs an output folder, stdout carries command replies', file=sys.stderr)
+            sys.exit(2)
+        # Build every source once, then keep them warm and serve commands:
+        daemon = fsm_daemon(args.out_folder, args.graph, args.verilog, graph_opts, verilog_opts, tb_opts, args.minimize, args.minimize_conds)
+        for r in daemon.add(args.sources):
+            print('%-7s %s (%.1f ms)' % (r['status'], r['source'], r['ms']), file=sys.stderr)
+            if 'error' in r:
+                print(r['error'], file=sys.stderr)
+        daemon.serve(not args.no_stdin, args.socket, args.watch_interval)
+        return
+    if not args.sources:
+        # Get FSM:
+        counter = cntr_exmp()
+        if (args.minimize):
+            # Merge equivalent states:
+            for name, names in counter.minimize().items():
+                print('merged %s into %s' % (', '.join(names), name), file=sys.stderr)
+        if (args.minimize_conds):
+            # Minimize emitted conditions:
+            counter.minimize_conds()
+        if (args.graph):
+            # Generate graph, render its files in parallel:
+            counter.build_graph(args.out_folder, args.force, jobs=args.jobs, **graph_opts)
+        if (args.verilog):
+            # Generate verilog:
+            counter.build_verilog(args.out_folder, args.force, **verilog_opts)
+        if (tb_opts is not None):
+            # Generate testbench and vectors with the verilog state encoding:
+            counter.build_testbench(args.out_folder, force=args.force, encoding=verilog_opts['encoding'],
+                                    encoding_table=verilog_opts.get('encoding_table'), **tb_opts)
+        if counter.stats is not None:
+            report_profiles(args, [('examples.examples:cntr_exmp', None, counter.stats.as_dict())])
+        return
+    # Build every source, report failures per FSM:
+    results = run_batch(args.sources, args.out_folder, args.graph, args.verilog, args.jobs, args.force, graph_opts, args.minimize, verilog_opts, args.minimize_conds, tb_opts)
+    failed = 0
+    for source, error, _ in results:
+        if error is None:
+            print('OK     ' + source, file=sys.stderr)
+        else:
+            failed += 1
+            print('FAILED ' + source + '\n' + error, file=sys.stderr)
+    print('%d of %d FSMs built' % (len(results) - failed, len(results)), file=sys.stderr)
+    report_profiles(args, results)
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,54 @@
+##################################################################
+#############         test_bdd.py                 ################
+# 1. Randomized cross-check of the BDD equivalence engine ########
+#    against the exhaustive reference mode #######################
+# 2. Node table size and depth of wide and deep conditions #######
+##################################################################
+
+# imports:
+import random
+import pytest
+from benchmarks.bench_pipeline import gen_cond
+from library.base_classes import arch, input
+from library.bdd import bdd_manager, bdd_overflow, cond_2_bdd
+from library.cond_compare import unite_conds
+from library.cond_parser import parse
+from library.inferring import get_fsm_interface
+
+# Returns the condition indices of 'conds' united in 'mode', one arch per condition
+def _get_indices(conds, mode):
+    archs = [arch('S' + str(i % 3), 'S' + str((i + 1) % 3), c, 'o = 1') for i, c in enumerate(conds)]
+    unite_conds(archs, get_fsm_interface(archs), mode)
+    return [a.index for a in archs]
+
+# Equivalent conditions are drawn often: repeated, and over few narrow signals, so that classes are not all singletons
+@pytest.mark.parametrize('seed', range(40))
+def test_bdd_matches_exhaustive(seed):
+    rnd = random.Random(seed)
+    inputs = ['in_' + str(i) for i in range(rnd.randint(1, 3))]
+    pool = [gen_cond(rnd, inputs, rnd.randint(1, 2), rnd.randint(0, 2), 0.25) for _ in range(5)]
+    conds = [rnd.choice(pool) if rnd.random() < 0.4 else gen_cond(rnd, inputs, 2, rnd.randint(0, 2), 0.25) for _ in range(14)]
+    assert _get_indices(conds, 'bdd') == _get_indices(conds, 'exhaustive')
+
+def test_bdd_equivalent_forms():
+    conds = ['a = 1 and b = 0', 'not (a != 1 or b != 0)', 'a > 0 and b < 1', 'a = b', 'b = a', 'not (a != b)']
+    assert _get_indices(conds, 'bdd') == [1, 1, 1, 2, 2, 2]
+
+# Independent signals are laid out one after another, a disjunction over them stays polynomial in the number of bits
+# (bits interleaved across all signals need more than 2^16 nodes)
+def test_bdd_independent_signals_stay_small():
+    sigs = [input('in_' + str(i), 8) for i in range(16)]
+    m = bdd_manager(sigs)
+    cond_2_bdd(parse(' or '.join([s.name + ' = ' + str(i + 1) for i, s in enumerate(sigs)])), m)
+    assert len(m.nodes) < 16 * 8 * 16
+
+def test_bdd_deep_condition():
+    sigs = [input('in_' + str(i), 16) for i in range(80)]
+    m = bdd_manager(sigs)
+    cond_2_bdd(parse(' and '.join([s.name + ' != ' + str(i) for i, s in enumerate(sigs)])), m)
+
+def test_bdd_overflow():
+    sigs = [input('a', 16), input('b', 16)]
+    m = bdd_manager(sigs, [('a', 'b')], max_nodes=64)
+    with pytest.raises(bdd_overflow):
+        cond_2_bdd(parse('a < b'), m)
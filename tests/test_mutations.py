@@ -0,0 +1,74 @@
+##################################################################
+#############         test_mutations.py           ################
+# 1. Randomized arch mutations of an fsm compared with a fresh ###
+#    fsm built from the mutated arch list ########################
+##################################################################
+
+# imports:
+import contextlib
+import io
+import random
+import numpy as np
+import pytest
+from benchmarks.bench_pipeline import gen_fsm
+from library.base_classes import arch
+from library.equiv_cache import set_default_equiv_cache
+from library.fsm_class import fsm
+
+# Returns everything derived from the arch list of 'm': interface, states, condition indices, verilog body, graph,
+# minimized conditions and cond_fn / out_fn results on random input vectors
+def _snapshot(m):
+    v = io.StringIO()
+    g = io.StringIO()
+    with contextlib.redirect_stderr(io.StringIO()):
+        m.write_verilog(v)
+    m.write_graph(g)
+    rnd = random.Random(0)
+    vectors = np.array([[rnd.randrange(1 << i.width) for i in m.inputs] for _ in range(8)], dtype=np.int64).reshape(8, len(m.inputs))
+    evals = []
+    for a in m.arch_list:
+        outs = [None if value is None else np.broadcast_to(value, 8).tolist() for value in a.out_fn(vectors)]
+        evals.append((a.cond_fn(vectors).tolist(), outs))
+    return ([(i.name, i.width) for i in m.inputs], [(o.name, o.width, o.default) for o in m.outputs],
+            m.default_state.name, [s.name for s in m.states], [(a.source.name, a.dest.name, a.index) for a in m.arch_list],
+            v.getvalue().split('\n', 2)[2], g.getvalue(), evals,
+            None if m.min_conds is None else sorted([(k, repr(c)) for k, c in m.min_conds.items()]))
+
+@pytest.fixture
+def equiv_cache_path(tmp_path):
+    yield str(tmp_path / 'equiv_cache.sqlite')
+    set_default_equiv_cache(None)
+
+@pytest.mark.parametrize('seed', range(30))
+def test_mutations_match_rebuild(seed, equiv_cache_path):
+    rnd = random.Random(seed)
+    set_default_equiv_cache(equiv_cache_path if seed % 3 == 0 else None)
+    mode = 'exhaustive' if seed % 5 == 4 else 'bdd'
+    default_state = rnd.choice([None, 'S1'])
+    minimize = rnd.random() < 0.5
+    minimize_conds = rnd.random() < 0.4
+    strs = gen_fsm(rnd.randint(2, 6), rnd.randint(3, 12), rnd.randint(1, 3), rnd.randint(1, 3), rnd.randint(1, 3), 2, 0.2, seed)
+    pool = gen_fsm(rnd.randint(2, 8), 30, rnd.randint(1, 4), rnd.randint(1, 3), rnd.randint(1, 3), 2, 0.3, seed + 1000)
+    m = fsm([arch(*t) for t in strs], default_state=default_state, compare_mode=mode, minimize=minimize)
+    if minimize_conds:
+        m.minimize_conds()
+    for step in range(12):
+        op = rnd.choice(['add', 'insert', 'remove', 'replace'])
+        if op == 'add':
+            m.add_arch(arch(*rnd.choice(pool)))
+        elif op == 'insert':
+            m.add_arch(arch(*rnd.choice(pool)), rnd.randrange(len(m.arch_list) + 1))
+        elif op == 'remove' and len(m.arch_list) > 1:
+            m.remove_arch(rnd.choice([rnd.randrange(len(m.arch_list)), m.arch_list[0], -1]))
+        elif op == 'replace':
+            m.replace_arch(rnd.randrange(len(m.arch_list)), arch(*rnd.choice(pool)))
+        fresh = fsm([arch(a.source.name, a.dest.name, a.cond, a.out) for a in m.arch_list], default_state=default_state,
+                    compare_mode=mode, minimize=minimize)
+        if minimize_conds:
+            fresh.minimize_conds()
+        assert _snapshot(m) == _snapshot(fresh), 'step ' + str(step) + ' ' + op
+
+def test_remove_last_arch():
+    m = fsm([arch('IDLE', 'S1', 'go = 1', 'done = 1')])
+    with pytest.raises(ValueError):
+        m.remove_arch(0)